@@ -0,0 +1,81 @@
+"""
+Cold-start benchmark for the embedding preload modes.
+
+Usage:
+    python -m benchmarks.cold_start --modes eager background
+
+For each EMBEDDING_PRELOAD mode it measures, in fresh processes:
+  - how long `import main` takes,
+  - how long a uvicorn worker takes to answer `/` after launch,
+  - how long until `/ready` reports the embedding model as loaded.
+
+`eager` matches the old behaviour of loading the model before serving. The
+model is loaded for real, so run it where the MiniLM weights are cached.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def service_env(mode: str) -> dict:
+    env = dict(os.environ, EMBEDDING_PRELOAD=mode)
+    env.setdefault("GROQ_API_KEY", "stub")
+    env.setdefault("QDRANT_URL", "http://qdrant.local:6333")
+    env.setdefault("WEATHER_API_KEY", "stub")
+    return env
+
+
+def measure_import(mode: str) -> float:
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=ROOT, env=service_env(mode), text=True)
+    return float(output.strip().splitlines()[-1])
+
+
+def wait_for(url: str, started: float, timeout: float) -> float:
+    while time.perf_counter() - started < timeout:
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    return float("nan")
+
+
+def measure_server(mode: str, port: int, timeout: float) -> tuple:
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env=service_env(mode),
+    )
+    try:
+        first_response = wait_for(f"http://127.0.0.1:{port}/", started, timeout)
+        ready = wait_for(f"http://127.0.0.1:{port}/ready", started, timeout)
+        return first_response, ready
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(args):
+    print(f"{'mode':<12}{'import s':>10}{'first / s':>12}{'ready s':>10}")
+    for mode in args.modes:
+        import_seconds = min(measure_import(mode) for _ in range(args.repeat))
+        first_response, ready = measure_server(mode, args.port, args.timeout)
+        print(f"{mode:<12}{import_seconds:>10.2f}{first_response:>12.2f}{ready:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=["eager", "background"], default=["eager", "background"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=120)
+    main(parser.parse_args())
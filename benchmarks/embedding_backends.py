@@ -0,0 +1,224 @@
+"""
+Accuracy and latency of the embedding backends against the PyTorch baseline.
+
+Usage:
+    python -m benchmarks.embedding_backends --backends torch onnx onnx-int8 torch-int8
+    python -m benchmarks.embedding_backends --qdrant-url https://... --api-key ... --top-k 5 --json backends.json
+
+Each backend runs in a fresh process (`--measure BACKEND`), so its import and
+load time and its memory are measured from a clean start. The process records:
+- the time to import and load the model, and the RSS it added;
+- single-query latency (p50/p95/p99), the way the batcher sees a quiet service;
+- throughput at batch size --batch-size;
+- the vectors for every query.
+
+The first backend is the baseline (torch unless given otherwise). Every other
+backend is compared with it on:
+- the cosine similarity between its vectors and the baseline's (mean and worst
+  query);
+- with --qdrant-url, the retrieval results: the same search the service runs
+  (`AdvisoryRetriever`, filtered on crop and soil type with --crop-key and
+  --soil-key, unfiltered when a filter matches nothing) is sent once with
+  each backend's vectors, and the report gives how often the top hit is the
+  baseline's top hit and the mean overlap of the top --top-k hits.
+
+The queries are what `main.retrieval_query` builds for synthetic sensor
+histories across several crops and soil types, or one query per line of
+--queries. The models are loaded for real, so run this where the MiniLM files
+are cached or can be downloaded; the backends need sentence-transformers
+(torch, torch-int8) or onnxruntime (onnx, onnx-int8) installed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmarks import payloads, stubs
+from benchmarks.replay import ROOT, percentiles, rss_kib
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+CROPS = ["Wheat", "Rice", "Maize", "Cotton", "Sugarcane", "Potato"]
+SOIL_TYPES = ["Loamy", "Clay", "Sandy", "Silt"]
+
+
+def synthetic_queries(count: int) -> List[dict]:
+    """Retrieval queries as the service builds them, with the crop and soil type they filter on."""
+    stubs.install_fake_environment()
+    # Only the query text is needed here; the models are loaded in the --measure processes
+    stubs.install_fake_sentence_transformers()
+    from main import retrieval_query
+
+    queries = []
+    for i in range(count):
+        crop, soil_type = CROPS[i % len(CROPS)], SOIL_TYPES[(i // len(CROPS)) % len(SOIL_TYPES)]
+        history = payloads.sensor_history(f"device-{i}", count=4 + i % 20)
+        queries.append({"text": retrieval_query(history, crop, soil_type), "crop": crop, "soil_type": soil_type})
+    return queries
+
+
+def file_queries(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [{"text": line.strip(), "crop": None, "soil_type": None} for line in f if line.strip()]
+
+
+def measure(backend: str, texts: List[str], batch_size: int, repeats: int, threads: Optional[int]) -> dict:
+    """Load `backend` in this process, time it on `texts` and return the timings and vectors."""
+    from embeddings import load_backend
+
+    rss_before = rss_kib(os.getpid()) or 0
+    started = time.perf_counter()
+    model = load_backend(backend, MODEL_NAME, threads)
+    # The first encode creates the ONNX Runtime session and warms torch's kernels
+    model.encode(texts[:1])
+    load_seconds = time.perf_counter() - started
+    rss_after = rss_kib(os.getpid()) or 0
+
+    single = []
+    for text in texts[: max(1, len(texts) // 2)]:
+        start = time.perf_counter()
+        model.encode([text])
+        single.append(time.perf_counter() - start)
+
+    batched = [texts[i % len(texts)] for i in range(batch_size)]
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model.encode(batched, batch_size=batch_size)
+    batch_seconds = (time.perf_counter() - start) / repeats
+
+    vectors = np.asarray(model.encode(texts, batch_size=batch_size), dtype=np.float32)
+    return {
+        "backend": backend,
+        "loadSeconds": load_seconds,
+        "loadRssMiB": (rss_after - rss_before) / 1024,
+        "single": percentiles(single),
+        "batchSize": batch_size,
+        "batchSeconds": batch_seconds,
+        "textsPerSecond": batch_size / batch_seconds,
+        "vectors": vectors,
+    }
+
+
+def run_measurement(args, backend: str, queries_path: str, out_dir: str) -> dict:
+    command = [sys.executable, "-m", "benchmarks.embedding_backends", "--measure", backend,
+               "--queries", queries_path, "--out", out_dir,
+               "--batch-size", str(args.batch_size), "--repeats", str(args.repeats)]
+    if args.threads:
+        command += ["--threads", str(args.threads)]
+    output = subprocess.check_output(command, cwd=ROOT, text=True)
+    result = json.loads(output.strip().splitlines()[-1])
+    result["vectors"] = np.load(os.path.join(out_dir, f"{backend}.npy"))
+    return result
+
+
+def cosine_agreement(baseline: np.ndarray, vectors: np.ndarray) -> Dict[str, float]:
+    def unit(matrix):
+        return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+    cosines = np.einsum("ij,ij->i", unit(baseline), unit(vectors))
+    return {"meanCosine": float(cosines.mean()), "minCosine": float(cosines.min())}
+
+
+async def qdrant_hits(args, queries: List[dict], vectors: np.ndarray) -> List[List[str]]:
+    """Point ids the service's retrieval path returns for each query, unfiltered fallback included."""
+    from qdrant_client import AsyncQdrantClient
+
+    from retrieval import AdvisoryRetriever
+
+    client = AsyncQdrantClient(url=args.qdrant_url, api_key=args.api_key)
+    retriever = AdvisoryRetriever(
+        client, args.collection, limit=args.top_k, crop_key=args.crop_key or None, soil_key=args.soil_key or None
+    )
+    try:
+        hits = []
+        for start in range(0, len(queries), 64):
+            chunk = queries[start:start + 64]
+            results = await retriever.search_many(
+                [vector.tolist() for vector in vectors[start:start + 64]],
+                [query["crop"] for query in chunk],
+                [query["soil_type"] for query in chunk],
+            )
+            hits.extend([str(hit["id"]) for hit in result] for result in results)
+        return hits
+    finally:
+        await client.close()
+
+
+def retrieval_agreement(baseline: List[List[str]], hits: List[List[str]], top_k: int) -> Dict[str, float]:
+    top1 = [bool(a and b and a[0] == b[0]) for a, b in zip(baseline, hits) if a]
+    overlap = [len(set(a[:top_k]) & set(b[:top_k])) / len(a[:top_k]) for a, b in zip(baseline, hits) if a]
+    return {
+        "top1Agreement": float(np.mean(top1)) if top1 else float("nan"),
+        f"overlapAt{top_k}": float(np.mean(overlap)) if overlap else float("nan"),
+    }
+
+
+def print_report(rows: List[dict], top_k: int):
+    print(f"{'backend':>10} {'load s':>7} {'load MiB':>9} {'p50 ms':>7} {'p99 ms':>7} {'texts/s':>8} "
+          f"{'mean cos':>9} {'min cos':>8} {'top-1':>6} {f'@{top_k}':>6}")
+    for row in rows:
+        print(f"{row['backend']:>10} {row['loadSeconds']:>7.1f} {row['loadRssMiB']:>9.0f} "
+              f"{row['single']['p50'] * 1000:>7.1f} {row['single']['p99'] * 1000:>7.1f} {row['textsPerSecond']:>8.0f} "
+              f"{row['meanCosine']:>9.4f} {row['minCosine']:>8.4f} "
+              f"{row.get('top1Agreement', float('nan')):>6.2f} {row.get(f'overlapAt{top_k}', float('nan')):>6.2f}")
+
+
+def main(args):
+    queries = file_queries(args.queries) if args.queries else synthetic_queries(args.count)
+    rows = []
+    with tempfile.TemporaryDirectory() as out_dir:
+        queries_path = os.path.join(out_dir, "queries.txt")
+        with open(queries_path, "w", encoding="utf-8") as f:
+            f.writelines(" ".join(query["text"].split()) + "\n" for query in queries)
+        for backend in args.backends:
+            rows.append(run_measurement(args, backend, queries_path, out_dir))
+
+    baseline = rows[0]
+    for row in rows:
+        row.update(cosine_agreement(baseline["vectors"], row["vectors"]))
+    if args.qdrant_url:
+        hits = [asyncio.run(qdrant_hits(args, queries, row["vectors"])) for row in rows]
+        for row, backend_hits in zip(rows, hits):
+            row.update(retrieval_agreement(hits[0], backend_hits, args.top_k))
+
+    for row in rows:
+        del row["vectors"]
+    print(f"{len(queries)} queries, baseline {baseline['backend']}")
+    print_report(rows, args.top_k)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8", "torch-int8"],
+                        help="backends to compare; the first is the baseline")
+    parser.add_argument("--queries", help="file with one query per line (default: synthetic retrieval queries)")
+    parser.add_argument("--count", type=int, default=200, help="number of synthetic queries")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=10, help="timed batches per backend")
+    parser.add_argument("--threads", type=int, help="intra-op threads for the ONNX backends")
+    parser.add_argument("--qdrant-url", help="also compare the retrieval results from this Qdrant")
+    parser.add_argument("--api-key")
+    parser.add_argument("--collection", default="documents")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--crop-key", help="payload field to filter the crop on, as RETRIEVAL_CROP_KEY")
+    parser.add_argument("--soil-key", help="payload field to filter the soil type on, as RETRIEVAL_SOIL_KEY")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        texts = file_queries(args.queries)
+        result = measure(args.measure, [query["text"] for query in texts], args.batch_size, args.repeats, args.threads)
+        np.save(os.path.join(args.out, f"{args.measure}.npy"), result.pop("vectors"))
+        print(json.dumps(result))
+    else:
+        main(args)
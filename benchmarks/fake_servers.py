@@ -0,0 +1,269 @@
+"""
+Local HTTP stand-ins for Groq, Qdrant and Visual Crossing.
+
+Usage:
+    python -m benchmarks.fake_servers --port 8900 --llm-latency 0.5 --llm-jitter 0.1
+
+One app serves the subset of each API that main.py uses, so the service can be
+pointed at it with GROQ_BASE_URL, QDRANT_URL and WEATHER_BASE_URL and run
+unmodified with no network:
+  - Groq: POST /openai/v1/chat/completions, plain and streamed, with usage counts;
+    with --llm-max-concurrency, calls beyond that many in flight get a 429 with
+    retry-after, like the provider's rate limiter
+  - Qdrant: search, batch search, scroll and payload index creation over a
+    synthetic collection searched exactly with NumPy
+  - Visual Crossing: the timeline endpoint
+
+Every response waits for a latency drawn from a normal distribution with the
+configured mean and jitter (standard deviation), clipped at zero.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CROPS = ("Wheat", "Rice", "Maize", "Cotton", "Sugarcane")
+SOILS = ("Loamy", "Clay", "Sandy", "Silty")
+
+ADVISORIES = {"advisories": [{
+    "title": "Split nitrogen application",
+    "precaution": "Avoid applying urea before the forecast rain.",
+    "risk_factors": "Nitrogen loss through leaching lowers tiller count.",
+    "recommended_action": "Apply 25 kg/ha urea after the rain, then 25 kg/ha at booting.",
+}]}
+TASKS = {"tasks": [{
+    "taskTitle": "Apply 25 kg/ha urea",
+    "taskDescription": "Broadcast 25 kg/ha urea on the loamy plots after irrigation.",
+    "taskSeverity": "MEDIUM",
+    "deadliestDeadline": "2025-05-15T12:00:00Z",
+}]}
+UPDATED_TASKS = {"updatedTasks": [{"id": 1, "taskSeverity": "HIGH", "notes": "Soil moisture is falling fast."}]}
+REPORT = {
+    "farm_health": ["Nitrogen is trending down over the week."],
+    "risk_analysis": ["Heat stress is likely during grain filling."],
+    "yield_forecast": ["Yield is on track if irrigation is kept up."],
+}
+
+
+@dataclass
+class Latency:
+    mean: float
+    jitter: float = 0.0
+
+    def sample(self) -> float:
+        return max(0.0, random.gauss(self.mean, self.jitter)) if self.jitter else self.mean
+
+    async def wait(self):
+        await asyncio.sleep(self.sample())
+
+
+def completion_for(prompt: str) -> str:
+    """Pick a reply shaped like the endpoint's expected output from the prompt text."""
+    if '"updatedTasks"' in prompt:
+        return json.dumps(UPDATED_TASKS)
+    if "farm_health" in prompt:
+        return json.dumps(REPORT)
+    if '"tasks"' in prompt:
+        return json.dumps(TASKS)
+    return json.dumps(ADVISORIES)
+
+
+class FakeCollection:
+    def __init__(self, size: int, dimensions: int = 384, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        vectors = rng.normal(size=(size, dimensions)).astype(np.float32)
+        self.vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.payloads = [
+            {
+                "crop": CROPS[i % len(CROPS)],
+                "soil_type": SOILS[i % len(SOILS)],
+                "text": f"Advisory {i}: keep soil moisture near field capacity and split nitrogen doses.",
+            }
+            for i in range(size)
+        ]
+
+    def _allowed(self, query_filter) -> np.ndarray:
+        allowed = np.ones(len(self.payloads), dtype=bool)
+        for condition in (query_filter or {}).get("must") or []:
+            key, value = condition["key"], condition["match"]["value"]
+            allowed &= np.fromiter((payload.get(key) == value for payload in self.payloads), dtype=bool)
+        return allowed
+
+    def _payload(self, index: int, with_payload) -> dict:
+        if with_payload is True:
+            return self.payloads[index]
+        if isinstance(with_payload, list):
+            return {key: value for key, value in self.payloads[index].items() if key in with_payload}
+        return None
+
+    def search(self, request: dict) -> list:
+        query = np.asarray(request["vector"], dtype=np.float32)
+        scores = np.where(self._allowed(request.get("filter")), self.vectors @ query, -np.inf)
+        top = np.argsort(-scores)[: request.get("limit", 10)]
+        return [
+            {"id": int(i), "version": 0, "score": float(scores[i]), "payload": self._payload(i, request.get("with_payload", False))}
+            for i in top
+            if np.isfinite(scores[i])
+        ]
+
+    def scroll(self, request: dict) -> dict:
+        offset = int(request.get("offset") or 0)
+        end = min(offset + request.get("limit", 10), len(self.payloads))
+        points = [
+            {
+                "id": i,
+                "payload": self._payload(i, request.get("with_payload", True)),
+                "vector": self.vectors[i].tolist() if request.get("with_vector") else None,
+            }
+            for i in range(offset, end)
+        ]
+        return {"points": points, "next_page_offset": end if end < len(self.payloads) else None}
+
+
+def qdrant_response(result) -> dict:
+    return {"result": result, "status": "ok", "time": 0.0}
+
+
+def create_app(
+    llm: Latency,
+    qdrant: Latency,
+    weather: Latency,
+    points: int = 1000,
+    stream_chunk: int = 16,
+    llm_max_concurrency: Optional[int] = None,
+    retry_after: float = 1.0,
+) -> FastAPI:
+    app = FastAPI()
+    collection = FakeCollection(points)
+    llm_in_flight = 0
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        nonlocal llm_in_flight
+        if llm_max_concurrency is not None and llm_in_flight >= llm_max_concurrency:
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "tokens", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={"retry-after": str(retry_after)},
+            )
+        llm_in_flight += 1
+        try:
+            return await completion(await request.json())
+        finally:
+            llm_in_flight -= 1
+
+    async def completion(body: dict):
+        # The first message is the endpoint prompt; retries append a correction after it
+        content = completion_for(body["messages"][0]["content"])
+        usage = {
+            "prompt_tokens": sum(len(message["content"]) for message in body["messages"]) // 4,
+            "completion_tokens": len(content) // 4,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "created": int(time.time()), "model": body["model"]}
+
+        if not body.get("stream"):
+            await llm.wait()
+            return {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        async def events():
+            nonlocal llm_in_flight
+            llm_in_flight += 1
+            try:
+                # Spread the latency over the chunks the way tokens arrive from the real API
+                chunks = [content[i : i + stream_chunk] for i in range(0, len(content), stream_chunk)]
+                delay = llm.sample() / len(chunks)
+                for chunk in chunks:
+                    await asyncio.sleep(delay)
+                    choice = {"index": 0, "delta": {"content": chunk}, "finish_reason": None}
+                    yield f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [choice]})}\n\n"
+                final = {**base, "object": "chat.completion.chunk", "x_groq": {"id": base["id"], "usage": usage},
+                         "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                yield f"data: {json.dumps(final)}\n\n"
+                yield "data: [DONE]\n\n"
+            finally:
+                llm_in_flight -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/")
+    async def qdrant_root():
+        return {"title": "qdrant - vector search engine", "version": "1.13.0"}
+
+    @app.post("/collections/{collection_name}/points/search")
+    async def search(collection_name: str, request: Request):
+        body = await request.json()
+        await qdrant.wait()
+        return qdrant_response(collection.search(body))
+
+    @app.post("/collections/{collection_name}/points/search/batch")
+    async def search_batch(collection_name: str, request: Request):
+        body = await request.json()
+        await qdrant.wait()
+        return qdrant_response([collection.search(search_request) for search_request in body["searches"]])
+
+    @app.post("/collections/{collection_name}/points/scroll")
+    async def scroll(collection_name: str, request: Request):
+        body = await request.json()
+        await qdrant.wait()
+        return qdrant_response(collection.scroll(body))
+
+    @app.put("/collections/{collection_name}/index")
+    async def create_index(collection_name: str):
+        return qdrant_response({"operation_id": 0, "status": "completed"})
+
+    @app.get("/VisualCrossingWebServices/rest/services/timeline/{location}/next3days")
+    async def timeline(location: str):
+        await weather.wait()
+        days = [
+            {
+                "datetime": f"2025-05-1{i}", "tempmax": 31.0 + i, "tempmin": 19.0, "humidity": 48.0,
+                "precip": 0.0 if i % 2 else 2.5, "precipprob": 40.0, "windspeed": 12.0,
+                "cloudcover": 30.0, "uvindex": 8, "conditions": "Partially cloudy",
+            }
+            for i in range(4)
+        ]
+        return {"address": location, "days": days}
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-max-concurrency", type=int, help="answer 429 beyond this many calls in flight")
+    parser.add_argument("--qdrant-latency", type=float, default=0.03)
+    parser.add_argument("--qdrant-jitter", type=float, default=0.01)
+    parser.add_argument("--weather-latency", type=float, default=0.15)
+    parser.add_argument("--weather-jitter", type=float, default=0.05)
+    parser.add_argument("--points", type=int, default=1000, help="size of the synthetic Qdrant collection")
+    args = parser.parse_args()
+    uvicorn.run(
+        create_app(
+            Latency(args.llm_latency, args.llm_jitter),
+            Latency(args.qdrant_latency, args.qdrant_jitter),
+            Latency(args.weather_latency, args.weather_jitter),
+            points=args.points,
+            llm_max_concurrency=args.llm_max_concurrency,
+        ),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+    )
@@ -0,0 +1,59 @@
+"""
+Concurrency load test for a single worker with every external service stubbed.
+
+Usage:
+    python -m benchmarks.load_test --requests 64 --concurrency 1 4 16 64
+
+If the endpoints block the event loop, throughput stays flat as concurrency
+grows; with the async pipeline it scales until the stub latencies dominate.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks import payloads, stubs
+
+
+async def run_level(app, path: str, body_factory, total: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+
+        async def one(i: int):
+            async with semaphore:
+                response = await client.post(path, json=body_factory(f"device-{i}"))
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        return time.perf_counter() - start
+
+
+async def main(args):
+    stubs.install_fake_environment()
+    stubs.install_fake_sentence_transformers(args.encode_latency)
+    import main as service
+    from weather import WeatherClient
+
+    service.groq_client = stubs.FakeGroqClient(args.llm_latency)
+    service.advisory_retriever.client = stubs.FakeQdrantClient(args.qdrant_latency)
+    service.weather_client = WeatherClient(stubs.fake_weather_client(args.weather_latency), api_key="stub")
+
+    print(f"{'endpoint':<18}{'concurrency':>12}{'seconds':>10}{'req/s':>10}")
+    for path, factory in (("/events", payloads.farm_request), ("/generate-tasks", payloads.farm_request_tasks)):
+        for concurrency in args.concurrency:
+            elapsed = await run_level(service.app, path, factory, args.requests, concurrency)
+            print(f"{path:<18}{concurrency:>12}{elapsed:>10.2f}{args.requests / elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--qdrant-latency", type=float, default=0.03)
+    parser.add_argument("--weather-latency", type=float, default=0.15)
+    parser.add_argument("--encode-latency", type=float, default=0.005)
+    asyncio.run(main(parser.parse_args()))
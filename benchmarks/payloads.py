@@ -0,0 +1,83 @@
+"""Sample request bodies shaped like the ones devices send."""
+import random
+
+
+def farm_info(device_id: str = "device-1", latitude: float = 31.52, longitude: float = 74.35) -> dict:
+    return {
+        "id": 1,
+        "totalLandArea": 12.5,
+        "farmLocation": "Lahore",
+        "latitude": str(latitude),
+        "longitude": str(longitude),
+        "deviceId": device_id,
+        "soilType": "Loamy",
+        "waterSource": "Canal",
+        "crop": "Wheat",
+        "sowingDate": "2025-11-10",
+        "currentGrowthStage": "Tillering",
+        "idealGrowingConditions": "15-25°C, moderate moisture",
+        "pastPestIssues": False,
+        "preferredMoistureLevel": "60%",
+        "irrigationType": "Drip",
+        "waterAvailabilityStatus": "Adequate",
+        "fertilizersUsed": ["Urea", "DAP"],
+    }
+
+
+def sensor_history(device_id: str = "device-1", count: int = 12) -> list:
+    rng = random.Random(device_id)
+    return [
+        {
+            "id": i,
+            "deviceId": device_id,
+            "nitrogen": round(rng.uniform(20, 60), 1),
+            "potassium": round(rng.uniform(100, 200), 1),
+            "phosphorus": round(rng.uniform(10, 40), 1),
+            "conductivity": round(rng.uniform(0.5, 2.0), 2),
+            "pH": round(rng.uniform(6.0, 7.5), 2),
+            "humidity": round(rng.uniform(30, 70), 1),
+            "temperature": round(rng.uniform(15, 30), 1),
+            "userId": 1,
+            "createdAt": f"2025-12-{(i % 28) + 1:02d}T06:00:00Z",
+        }
+        for i in range(count)
+    ]
+
+
+def advisories() -> list:
+    return [
+        {
+            "title": "Nitrogen top-dressing",
+            "precaution": "Avoid application before rain",
+            "risk_factors": "Reduced tillering",
+            "recommended_action": "Apply 25 kg/acre urea",
+            "createdAt": "2025-12-10T06:00:00Z",
+        }
+    ]
+
+
+def tasks(device_id: str = "device-1") -> list:
+    return [
+        {
+            "id": 1,
+            "taskTitle": "Irrigate field",
+            "taskDescription": "Run drip irrigation for 2 hours",
+            "taskSeverity": "MEDIUM",
+            "taskStatus": "Pending",
+            "deviceId": device_id,
+            "deadliestDeadline": "2025-12-12T12:00:00Z",
+            "createdAt": "2025-12-10T06:00:00Z",
+        }
+    ]
+
+
+def farm_request(device_id: str = "device-1") -> dict:
+    return {"farm_info": farm_info(device_id), "npk_data": sensor_history(device_id)}
+
+
+def farm_request_tasks(device_id: str = "device-1") -> dict:
+    return {**farm_request(device_id), "advisories": advisories()}
+
+
+def farm_request_updated_tasks(device_id: str = "device-1") -> dict:
+    return {**farm_request_tasks(device_id), "tasks": tasks(device_id)}
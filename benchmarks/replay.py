@@ -0,0 +1,253 @@
+"""
+Offline end-to-end benchmark: the real service over HTTP against local fakes.
+
+Usage:
+    python -m benchmarks.replay --rate 20 --duration 30
+    python -m benchmarks.replay --payloads recorded.jsonl --rate 50 --json results.json
+
+Starts `benchmarks.fake_servers` and `benchmarks.serve` as separate processes on
+free local ports. It then sends requests open-loop at --rate requests per
+second for --duration seconds. Arrivals are Poisson with --poisson and evenly
+spaced otherwise, and requests do not wait for earlier ones to finish, so
+queueing shows up in the latencies.
+
+The bodies come from --payloads, a JSONL file with one {"path": ..., "body": ...}
+object per line. Without it, a mix of all four endpoints and the three
+streaming ones is generated with `benchmarks.payloads`. A stream counts as an
+error when it sends an `error` event.
+
+The report gives throughput, p50/p95/p99 per endpoint and per pipeline stage
+(taken from the Server-Timing header), and the service's peak RSS.
+Nothing leaves the machine.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from benchmarks import payloads
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def default_mix(count: int) -> List[dict]:
+    factories = (
+        ("/events", payloads.farm_request),
+        ("/generate-tasks", payloads.farm_request_tasks),
+        ("/updated-tasks", payloads.farm_request_updated_tasks),
+        ("/generate-report", payloads.farm_request_updated_tasks),
+        ("/events/stream", payloads.farm_request),
+        ("/generate-tasks/stream", payloads.farm_request_tasks),
+        ("/generate-report/stream", payloads.farm_request_updated_tasks),
+    )
+    requests = []
+    for i in range(count):
+        path, factory = factories[i % len(factories)]
+        requests.append({"path": path, "body": factory(f"device-{i}")})
+    return requests
+
+
+def failed(response: httpx.Response) -> bool:
+    # Streams answer 200 up front and report failures as an `error` event
+    return response.status_code != 200 or "event: error" in response.text
+
+
+def load_payloads(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def rss_kib(pid: int) -> Optional[int]:
+    """Current resident set size of `pid` in KiB (/proc on Linux, ps elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        return int(subprocess.run(["ps", "-o", "rss=", "-p", str(pid)], capture_output=True, text=True).stdout)
+    except (OSError, ValueError):
+        return None
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    stages = {}
+    for entry in filter(None, (part.strip() for part in header.split(","))):
+        name, *params = entry.split(";")
+        for param in params:
+            if param.startswith("dur="):
+                stages[name] = float(param[4:]) / 1000
+    return stages
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) if samples else (float("nan"),) * 3
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+async def wait_until(url: str, deadline: float, process: subprocess.Popen):
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited with {process.returncode} before becoming ready")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready in time")
+
+
+async def replay(args, service_url: str, pid: int) -> dict:
+    bodies = load_payloads(args.payloads) if args.payloads else default_mix(max(64, int(args.rate * args.duration)))
+    total = int(args.rate * args.duration)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    stages: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    peak_rss = rss_kib(pid) or 0
+    rng = random.Random(args.seed)
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=256)
+    async with httpx.AsyncClient(base_url=service_url, timeout=args.timeout, limits=limits) as client:
+
+        async def send(request: dict):
+            start = time.perf_counter()
+            try:
+                response = await client.post(request["path"], json=request["body"])
+            except httpx.HTTPError:
+                errors[request["path"]] += 1
+                return
+            latencies[request["path"]].append(time.perf_counter() - start)
+            if failed(response):
+                errors[request["path"]] += 1
+            for name, seconds in parse_server_timing(response.headers.get("server-timing", "")).items():
+                stages[name].append(seconds)
+
+        async def sample_rss():
+            nonlocal peak_rss
+            while True:
+                peak_rss = max(peak_rss, rss_kib(pid) or 0)
+                await asyncio.sleep(0.1)
+
+        sampler = asyncio.create_task(sample_rss())
+        in_flight = []
+        start = time.perf_counter()
+        at = 0.0
+        for i in range(total):
+            delay = start + at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            in_flight.append(asyncio.create_task(send(bodies[i % len(bodies)])))
+            at += rng.expovariate(args.rate) if args.poisson else 1 / args.rate
+        await asyncio.gather(*in_flight)
+        elapsed = time.perf_counter() - start
+        sampler.cancel()
+        peak_rss = max(peak_rss, rss_kib(pid) or 0)
+        metrics = (await client.get("/metrics")).text
+
+    completed = sum(len(samples) for samples in latencies.values())
+    return {
+        "requests": total,
+        "seconds": elapsed,
+        "throughput": completed / elapsed,
+        "peakRssMiB": peak_rss / 1024,
+        "endpoints": {
+            path: {"count": len(samples), "errors": errors[path], **percentiles(samples)}
+            for path, samples in sorted(latencies.items())
+        },
+        "stages": {name: {"count": len(samples), **percentiles(samples)} for name, samples in stages.items()},
+        "metrics": metrics,
+    }
+
+
+def print_report(result: dict):
+    print(f"{result['requests']} requests in {result['seconds']:.1f}s, "
+          f"{result['throughput']:.1f} req/s, peak RSS {result['peakRssMiB']:.0f} MiB")
+    print(f"\n{'endpoint':<20}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for path, row in result["endpoints"].items():
+        print(f"{path:<20}{row['count']:>7}{row['errors']:>8}"
+              f"{row['p50'] * 1000:>10.1f}{row['p95'] * 1000:>10.1f}{row['p99'] * 1000:>10.1f}")
+    print(f"\n{'stage':<20}{'count':>7}{'p50 ms':>18}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in result["stages"].items():
+        print(f"{name:<20}{row['count']:>7}{row['p50'] * 1000:>18.1f}{row['p95'] * 1000:>10.1f}{row['p99'] * 1000:>10.1f}")
+
+
+async def main(args):
+    fake_port, service_port = free_port(), free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    fakes = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_servers", "--port", str(fake_port),
+         "--llm-latency", str(args.llm_latency), "--llm-jitter", str(args.llm_jitter),
+         "--qdrant-latency", str(args.qdrant_latency), "--qdrant-jitter", str(args.qdrant_jitter),
+         "--weather-latency", str(args.weather_latency), "--weather-jitter", str(args.weather_jitter)]
+        + (["--llm-max-concurrency", str(args.llm_max_concurrency)] if args.llm_max_concurrency else []),
+        cwd=ROOT,
+    )
+    env = dict(
+        os.environ,
+        GROQ_BASE_URL=fake_url,
+        GROQ_API_KEY="stub",
+        QDRANT_URL=fake_url,
+        WEATHER_BASE_URL=fake_url,
+        WEATHER_API_KEY="stub",
+    )
+    command = [sys.executable, "-m", "benchmarks.serve", "--port", str(service_port),
+               "--encode-latency", str(args.encode_latency)]
+    if args.real_encoder:
+        command.append("--real-encoder")
+    service = subprocess.Popen(command, cwd=ROOT, env=env)
+    try:
+        deadline = time.monotonic() + args.startup_timeout
+        await wait_until(f"{fake_url}/", deadline, fakes)
+        await wait_until(f"http://127.0.0.1:{service_port}/ready", deadline, service)
+        result = await replay(args, f"http://127.0.0.1:{service_port}", service.pid)
+    finally:
+        for process in (service, fakes):
+            process.terminate()
+            process.wait()
+
+    print_report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=20, help="requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--poisson", action="store_true", help="Poisson arrivals instead of evenly spaced")
+    parser.add_argument("--payloads", help="JSONL file of {path, body} requests to replay")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--real-encoder", action="store_true", help="load MiniLM instead of the stub encoder")
+    parser.add_argument("--encode-latency", type=float, default=0.005)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--llm-max-concurrency", type=int, help="fake Groq rate-limits beyond this many calls")
+    parser.add_argument("--qdrant-latency", type=float, default=0.03)
+    parser.add_argument("--qdrant-jitter", type=float, default=0.01)
+    parser.add_argument("--weather-latency", type=float, default=0.15)
+    parser.add_argument("--weather-jitter", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
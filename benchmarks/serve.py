@@ -0,0 +1,42 @@
+"""
+Run the service under uvicorn for benchmarking.
+
+Usage:
+    python -m benchmarks.serve --port 8000 [--real-encoder] [--workers 4 --torch-threads 1]
+
+Unless --real-encoder is given, the embedding model is replaced by the stub
+from `benchmarks.stubs` (same output shape, fixed encode latency, --stub-model-mib
+of resident weights) so the service starts without the MiniLM weights. With
+--workers the service runs under `prefork`, otherwise as a single uvicorn process. Point GROQ_BASE_URL, QDRANT_URL and
+WEATHER_BASE_URL at `benchmarks.fake_servers` to run fully offline.
+"""
+import argparse
+
+import uvicorn
+
+import prefork
+from benchmarks import stubs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--real-encoder", action="store_true")
+    parser.add_argument("--encode-latency", type=float, default=0.005)
+    parser.add_argument("--stub-model-mib", type=float, default=0)
+    parser.add_argument("--workers", type=int, help="serve from this many forked workers (prefork.py)")
+    parser.add_argument("--torch-threads", type=int, default=1)
+    parser.add_argument("--no-preload", action="store_true")
+    args = parser.parse_args()
+
+    stubs.install_fake_environment()
+    if not args.real_encoder:
+        stubs.install_fake_sentence_transformers(args.encode_latency, args.stub_model_mib)
+    if args.workers:
+        prefork.serve(
+            args.host, args.port, args.workers, args.torch_threads, log_level="warning", preload=not args.no_preload,
+        )
+    else:
+        import main as service
+
+        uvicorn.run(service.app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,101 @@
+"""
+Local stand-ins for the external services used by main.py.
+
+Each stub sleeps for a configurable latency instead of doing real work so the
+service can be exercised offline with realistic wait times.
+"""
+import asyncio
+import os
+import sys
+import time
+import types
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+
+
+def install_fake_environment():
+    """Provide dummy credentials so main.py can construct its clients."""
+    os.environ.setdefault("GROQ_API_KEY", "stub")
+    os.environ.setdefault("QDRANT_URL", "http://qdrant.local:6333")
+    os.environ.setdefault("WEATHER_API_KEY", "stub")
+
+
+def install_fake_sentence_transformers(encode_latency: float = 0.005, model_mib: float = 0):
+    """
+    Register a fake ``sentence_transformers`` module before main.py is imported.
+
+    `model_mib` gives the fake model that many MiB of resident weights, so memory
+    measurements see something the size of the real model (MiniLM is about 90 MiB).
+    """
+
+    class FakeSentenceTransformer:
+        def __init__(self, *args, **kwargs):
+            self.weights = np.random.rand(int(model_mib * 2**20 / 4)).astype(np.float32)
+
+        def encode(self, sentences, **kwargs):
+            # time.sleep releases the GIL just like the torch kernels do
+            time.sleep(encode_latency)
+            if isinstance(sentences, str):
+                return np.random.rand(384).astype(np.float32)
+            return np.random.rand(len(sentences), 384).astype(np.float32)
+
+    module = types.ModuleType("sentence_transformers")
+    module.SentenceTransformer = FakeSentenceTransformer
+    sys.modules["sentence_transformers"] = module
+
+
+class FakeQdrantClient:
+    def __init__(self, latency: float = 0.03):
+        self.latency = latency
+
+    async def search(self, collection_name, query_vector, limit=1, **kwargs):
+        await asyncio.sleep(self.latency)
+        return [
+            SimpleNamespace(id=i, score=0.9, payload={"text": "Apply nitrogen in split doses."})
+            for i in range(limit)
+        ]
+
+    async def search_batch(self, collection_name, requests, **kwargs):
+        await asyncio.sleep(self.latency)
+        return [
+            [SimpleNamespace(id=i, score=0.9, payload={"text": "Apply nitrogen in split doses."}) for i in range(request.limit)]
+            for request in requests
+        ]
+
+    async def close(self):
+        pass
+
+
+class FakeGroqClient:
+    def __init__(self, latency: float = 0.5, content: str = '{"tasks": []}'):
+        self.latency = latency
+        self.content = content
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, stream=False, **kwargs):
+        if stream:
+            return self._stream()
+        await asyncio.sleep(self.latency)
+        message = SimpleNamespace(content=self.content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    async def _stream(self, chunk_size: int = 8):
+        # Spread the latency over the tokens the way a streamed completion arrives
+        chunks = [self.content[i : i + chunk_size] for i in range(0, len(self.content), chunk_size)]
+        for chunk in chunks:
+            await asyncio.sleep(self.latency / len(chunks))
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=chunk))])
+
+    async def close(self):
+        pass
+
+
+def fake_weather_client(latency: float = 0.15) -> httpx.AsyncClient:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency)
+        days = [{"datetime": f"2025-05-1{i}", "tempmax": 31.0, "tempmin": 19.0, "precip": 0.0} for i in range(4)]
+        return httpx.Response(200, json={"days": days})
+
+    return httpx.AsyncClient(base_url="http://weather.local", transport=httpx.MockTransport(handler))
@@ -0,0 +1,197 @@
+"""
+Memory and throughput of the service as the number of prefork workers grows.
+
+Usage:
+    python -m benchmarks.workers --workers 1 2 4 8 --concurrency 64 --duration 20
+    python -m benchmarks.workers --workers 1 2 4 --compare --real-encoder --json workers.json
+
+For each worker count, `benchmarks.serve --workers N` is started against
+`benchmarks.fake_servers`. The request mix from `benchmarks.replay` is then
+sent closed-loop: --concurrency clients, each sending its next request as soon
+as the last one returns, for --duration seconds after a short warm-up.
+
+The fake LLM answers quickly by default, so the service's own CPU work sets
+the throughput. The LLM, change-gate and forecast caches are switched off so
+that every request does that work. For the master and each worker the
+benchmark records:
+- RSS;
+- PSS (proportional set size): shared pages are split between the processes
+  that map them, so the PSS sums to the real footprint.
+
+--compare runs every worker count a second time with --no-preload, where every
+worker loads its own copy of the model the way `uvicorn --workers` does.
+Without --real-encoder the stub model holds --stub-model-mib of weights, so
+the difference shows up without the MiniLM download.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.replay import ROOT, default_mix, failed, free_port, percentiles, rss_kib, wait_until
+
+
+def children_of(pid: int) -> List[int]:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name is in parentheses and may contain spaces
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+def pss_kib(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def memory(master: int) -> Dict[str, float]:
+    workers = children_of(master)
+    worker_rss = [rss_kib(pid) or 0 for pid in workers]
+    worker_pss = [pss_kib(pid) or 0 for pid in workers]
+    return {
+        "masterRssMiB": (rss_kib(master) or 0) / 1024,
+        "workerRssMiB": sum(worker_rss) / len(workers) / 1024 if workers else 0.0,
+        "workerPssMiB": sum(worker_pss) / len(workers) / 1024 if workers else 0.0,
+        "totalPssMiB": ((pss_kib(master) or 0) + sum(worker_pss)) / 1024,
+    }
+
+
+async def load(url: str, concurrency: int, warmup: float, duration: float, timeout: float) -> dict:
+    bodies = default_mix(max(256, concurrency * 4))
+    latencies: List[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        measure_from = time.perf_counter() + warmup
+        stop_at = measure_from + duration
+
+        async def client_loop(offset: int):
+            nonlocal errors
+            i = offset
+            while time.perf_counter() < stop_at:
+                request = bodies[i % len(bodies)]
+                i += concurrency
+                start = time.perf_counter()
+                try:
+                    response = await client.post(request["path"], json=request["body"])
+                    ok = not failed(response)
+                except httpx.HTTPError:
+                    ok = False
+                if start >= measure_from:
+                    latencies.append(time.perf_counter() - start)
+                    errors += not ok
+
+        await asyncio.gather(*(client_loop(offset) for offset in range(concurrency)))
+    return {"requests": len(latencies), "errors": errors, "throughput": len(latencies) / duration, **percentiles(latencies)}
+
+
+async def run_one(args, fake_url: str, workers: int, preload: bool) -> dict:
+    port = free_port()
+    env = dict(
+        os.environ,
+        GROQ_BASE_URL=fake_url,
+        GROQ_API_KEY="stub",
+        QDRANT_URL=fake_url,
+        WEATHER_BASE_URL=fake_url,
+        WEATHER_API_KEY="stub",
+        LLM_CACHE_TTL_EVENTS="0",
+        LLM_CACHE_TTL_TASKS="0",
+        LLM_CACHE_TTL_UPDATED_TASKS="0",
+        LLM_CACHE_TTL_REPORT="0",
+        CHANGE_GATE="0",
+        WEATHER_CACHE_TTL="0",
+    )
+    command = [sys.executable, "-m", "benchmarks.serve", "--port", str(port), "--workers", str(workers),
+               "--torch-threads", str(args.torch_threads), "--encode-latency", str(args.encode_latency),
+               "--stub-model-mib", str(args.stub_model_mib)]
+    if args.real_encoder:
+        command.append("--real-encoder")
+    if not preload:
+        command.append("--no-preload")
+    started = time.monotonic()
+    service = subprocess.Popen(command, cwd=ROOT, env=env)
+    try:
+        await wait_until(f"http://127.0.0.1:{port}/ready", time.monotonic() + args.startup_timeout, service)
+        # /ready answers as soon as one worker is up; give the others a moment to finish starting
+        await asyncio.sleep(1)
+        startup = time.monotonic() - started
+        result = await load(f"http://127.0.0.1:{port}", args.concurrency, args.warmup, args.duration, args.timeout)
+        result.update(memory(service.pid))
+    finally:
+        service.terminate()
+        service.wait()
+    return {"workers": workers, "preload": preload, "startupSeconds": startup, **result}
+
+
+def print_report(rows: List[dict]):
+    print(f"{'workers':>7} {'preload':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} "
+          f"{'master RSS':>11} {'worker RSS':>11} {'worker PSS':>11} {'total PSS':>10} {'startup s':>10}")
+    for row in rows:
+        print(f"{row['workers']:>7} {'yes' if row['preload'] else 'no':>7} {row['throughput']:>8.1f} "
+              f"{row['p50'] * 1000:>8.1f} {row['p99'] * 1000:>8.1f} {row['errors']:>7} "
+              f"{row['masterRssMiB']:>11.0f} {row['workerRssMiB']:>11.0f} {row['workerPssMiB']:>11.0f} "
+              f"{row['totalPssMiB']:>10.0f} {row['startupSeconds']:>10.1f}")
+
+
+async def main(args):
+    fake_port = free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    fakes = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_servers", "--port", str(fake_port),
+         "--llm-latency", str(args.llm_latency), "--llm-jitter", "0",
+         "--qdrant-latency", "0.005", "--qdrant-jitter", "0",
+         "--weather-latency", "0.005", "--weather-jitter", "0"],
+        cwd=ROOT,
+    )
+    rows = []
+    try:
+        await wait_until(f"{fake_url}/", time.monotonic() + args.startup_timeout, fakes)
+        for workers in args.workers:
+            for preload in (True, False) if args.compare else (True,):
+                rows.append(await run_one(args, fake_url, workers, preload))
+    finally:
+        fakes.terminate()
+        fakes.wait()
+
+    print_report(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--torch-threads", type=int, default=1)
+    parser.add_argument("--compare", action="store_true", help="also run every worker count without preloading")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--startup-timeout", type=float, default=120)
+    parser.add_argument("--real-encoder", action="store_true", help="load MiniLM instead of the stub encoder")
+    parser.add_argument("--stub-model-mib", type=float, default=90)
+    parser.add_argument("--encode-latency", type=float, default=0.005)
+    parser.add_argument("--llm-latency", type=float, default=0.01)
+    parser.add_argument("--json", help="also write the results to this file")
+    asyncio.run(main(parser.parse_args()))
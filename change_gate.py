@@ -0,0 +1,174 @@
+"""
+Skip recomputing a device's results when its farm state has not meaningfully changed.
+
+For each (endpoint, device), the gate keeps a snapshot of the inputs the
+last result was computed from:
+- the last and mean value of every sensor metric;
+- a reduction of the forecast (hottest day, coldest night, total rain,
+  strongest wind);
+- a hash of everything else in the request (farm profile, advisories,
+  tasks), together with which pending tasks are past their deadline, so a
+  deadline passing between two identical requests also counts as a change.
+
+A new request is scored against that snapshot as the largest per-metric
+change divided by the metric's tolerance. Anything but an exact match on the
+hashed part scores infinity. The previous result is returned while the score
+stays below 1.
+
+Scores are measured against the snapshot the result was computed from, not the
+previous request, so slow drift adds up until it crosses the tolerance.
+Hysteresis: once a change has triggered a recompute, the device counts as
+changing and keeps being recomputed until the score falls below `release`.
+This keeps results fresh while conditions are moving and quiet once they
+settle. Results older than `max_age` are always recomputed, as are those
+the caller forces.
+"""
+import hashlib
+import json
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import numpy as np
+
+from sensor_summary import METRICS, summarize
+from task_triage import is_final, is_overdue
+
+# Absolute change in a metric's last or mean value that makes a result stale
+SENSOR_TOLERANCES = {
+    "nitrogen": 5.0,
+    "phosphorus": 3.0,
+    "potassium": 10.0,
+    "pH": 0.2,
+    "conductivity": 0.2,
+    "humidity": 5.0,
+    "temperature": 2.0,
+}
+# Forecast field -> (reduction over the forecast days, tolerance)
+FORECAST_TOLERANCES = {
+    "tempmax": (np.max, 2.0),
+    "tempmin": (np.min, 2.0),
+    "precip": (np.sum, 5.0),
+    "windspeed": (np.max, 10.0),
+}
+
+
+@dataclass
+class Snapshot:
+    context: str
+    values: np.ndarray
+
+
+@dataclass
+class GateEntry:
+    snapshot: Snapshot
+    result: Any
+    computed_at: float
+    changing: bool = False
+
+
+class ChangeGate:
+    def __init__(
+        self,
+        sensor_tolerances: Optional[Dict[str, float]] = None,
+        release: float = 0.5,
+        max_age: float = 6 * 3600,
+        max_entries: int = 10000,
+    ):
+        sensor_tolerances = {**SENSOR_TOLERANCES, **(sensor_tolerances or {})}
+        # Each metric contributes its last and its mean value, both with the metric's tolerance
+        self.tolerances = np.array(
+            [sensor_tolerances[metric] for metric in METRICS for _ in range(2)]
+            + [tolerance for _, tolerance in FORECAST_TOLERANCES.values()],
+            dtype=np.float64,
+        )
+        self.release = release
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple[str, str], GateEntry]" = OrderedDict()
+        self.recomputed = 0
+        self.skipped = 0
+        self.forced = 0
+
+    def snapshot(self, farm_request: dict, weather_forecast: list) -> Snapshot:
+        context = {key: value for key, value in farm_request.items() if key != "npk_data"}
+        now = time.time()
+        context["overdue"] = sorted(
+            str(task.get("id")) for task in farm_request.get("tasks") or ()
+            if not is_final(task) and is_overdue(task, now)
+        )
+        summary = summarize(farm_request["npk_data"])
+        sensors = [
+            summary[metric][statistic] if metric in summary else math.nan
+            for metric in METRICS
+            for statistic in ("last", "mean")
+        ]
+        forecast = []
+        for name, (reduce, _) in FORECAST_TOLERANCES.items():
+            days = [day[name] for day in weather_forecast or () if day.get(name) is not None]
+            forecast.append(float(reduce(days)) if days else math.nan)
+        return Snapshot(
+            hashlib.sha256(json.dumps(context, sort_keys=True, default=str).encode("utf-8")).hexdigest(),
+            np.array(sensors + forecast, dtype=np.float64),
+        )
+
+    def score(self, previous: Snapshot, current: Snapshot) -> float:
+        """Largest change relative to its tolerance; infinite when the hashed inputs differ."""
+        if previous.context != current.context:
+            return math.inf
+        missing = np.isnan(previous.values) | np.isnan(current.values)
+        if (missing & (np.isnan(previous.values) != np.isnan(current.values))).any():
+            # A metric or forecast field appeared or disappeared
+            return math.inf
+        changes = np.abs(current.values - previous.values) / self.tolerances
+        return float(np.max(changes, where=~missing, initial=0.0))
+
+    async def get_or_compute(
+        self,
+        endpoint: str,
+        device_id: str,
+        farm_request: dict,
+        weather_forecast: list,
+        compute: Callable[[], Awaitable[dict]],
+        force: bool = False,
+        cacheable: Callable[[dict], bool] = bool,
+    ) -> dict:
+        """The previous result marked `recomputed: false` if nothing changed enough, else a fresh one."""
+        key = (endpoint, device_id)
+        current = self.snapshot(farm_request, weather_forecast)
+        entry = self._entries.get(key)
+        score = self.score(entry.snapshot, current) if entry is not None else math.inf
+        if entry is not None and not force and time.time() - entry.computed_at < self.max_age:
+            if score < (self.release if entry.changing else 1.0):
+                entry.changing = False
+                self._entries.move_to_end(key)
+                self.skipped += 1
+                return {**entry.result, "recomputed": False, "computedAt": _isoformat(entry.computed_at)}
+
+        if force:
+            self.forced += 1
+        self.recomputed += 1
+        result = await compute()
+        if cacheable(result):
+            self._entries[key] = GateEntry(
+                current, result, time.time(), changing=entry is not None and self.release <= score < math.inf
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return {**result, "recomputed": True, "computedAt": _isoformat(time.time())}
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "recomputed": self.recomputed,
+            "skipped": self.skipped,
+            "forced": self.forced,
+        }
+
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
@@ -0,0 +1,209 @@
+"""
+Server-side state per device, so clients send only what changed.
+
+Each device keeps its farm profile and a fixed-capacity ring buffer of sensor
+readings: one NumPy structured array with a column per metric, so appending a
+delta and reading the history back cost the same however long the device has
+been reporting. Readings are append-only. A reading whose createdAt is not
+newer than the latest stored one is treated as a resend and skipped.
+
+With a `path`, every update is written through to SQLite as one row per
+device (farm profile as JSON, readings as the raw array bytes). Devices evicted
+from memory, or lost in a restart, are loaded back on their next request.
+Each update reads, merges and writes the row in one `BEGIN IMMEDIATE`
+transaction, so processes sharing the file never overwrite each other's
+readings.
+"""
+import asyncio
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from sensor_summary import METRICS
+
+READING_DTYPE = np.dtype(
+    [("id", np.int64), ("userId", np.int64), ("createdAt", np.float64)]
+    + [(metric, np.float64) for metric in METRICS]
+)
+
+
+def _timestamp(created_at: str) -> float:
+    try:
+        return datetime.fromisoformat(created_at.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, ValueError):
+        return time.time()
+
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class SensorRing:
+    """The latest `capacity` readings of one device, oldest first when read back."""
+
+    def __init__(self, capacity: int, readings: Optional[np.ndarray] = None):
+        self.capacity = capacity
+        self._buffer = np.zeros(capacity, dtype=READING_DTYPE)
+        self._start = 0
+        self.count = 0
+        if readings is not None and len(readings):
+            self._write(readings[-capacity:])
+
+    @property
+    def latest(self) -> Optional[float]:
+        return float(self._buffer["createdAt"][(self._start + self.count - 1) % self.capacity]) if self.count else None
+
+    def _write(self, rows: np.ndarray):
+        end = (self._start + self.count) % self.capacity
+        positions = (end + np.arange(len(rows))) % self.capacity
+        self._buffer[positions] = rows
+        overflow = max(0, self.count + len(rows) - self.capacity)
+        self._start = (self._start + overflow) % self.capacity
+        self.count = min(self.capacity, self.count + len(rows))
+
+    def append(self, readings: List[dict]) -> int:
+        """Append readings newer than the latest stored one; returns how many were added."""
+        if not readings:
+            return 0
+        rows = np.zeros(len(readings), dtype=READING_DTYPE)
+        rows["id"] = [reading.get("id", 0) for reading in readings]
+        rows["userId"] = [reading.get("userId", 0) for reading in readings]
+        rows["createdAt"] = [_timestamp(reading.get("createdAt")) for reading in readings]
+        for metric in METRICS:
+            rows[metric] = [reading[metric] for reading in readings]
+        rows = rows[np.argsort(rows["createdAt"], kind="stable")]
+        if self.count:
+            rows = rows[rows["createdAt"] > self.latest]
+        rows = rows[-self.capacity:]
+        self._write(rows)
+        return len(rows)
+
+    def array(self) -> np.ndarray:
+        """The stored readings in chronological order."""
+        positions = (self._start + np.arange(self.count)) % self.capacity
+        return self._buffer[positions]
+
+    def records(self, device_id: str) -> List[dict]:
+        """The stored readings shaped like the `SensorData` request items."""
+        rows = self.array()
+        columns = {name: rows[name].tolist() for name in READING_DTYPE.names}
+        return [
+            {
+                "id": columns["id"][i],
+                "deviceId": device_id,
+                **{metric: columns[metric][i] for metric in METRICS},
+                "userId": columns["userId"][i],
+                "createdAt": _isoformat(columns["createdAt"][i]),
+            }
+            for i in range(len(rows))
+        ]
+
+
+class DeviceState:
+    def __init__(self, device_id: str, farm_info: Optional[dict], readings: SensorRing):
+        self.device_id = device_id
+        self.farm_info = farm_info
+        self.readings = readings
+
+
+class DeviceStateStore:
+    def __init__(self, history: int = 512, max_devices: int = 10000, path: Optional[str] = None):
+        self.history = history
+        self.max_devices = max_devices
+        self.path = path
+        self._devices: "OrderedDict[str, DeviceState]" = OrderedDict()
+        # Only devices with an update in flight have a lock: the lock and how many updates hold or await it
+        self._locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+        if path:
+            with sqlite3.connect(path) as db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS devices (device_id TEXT PRIMARY KEY, farm_info TEXT, readings BLOB)"
+                )
+
+    def _read_row(self, db: sqlite3.Connection, device_id: str) -> Optional[DeviceState]:
+        row = db.execute("SELECT farm_info, readings FROM devices WHERE device_id = ?", (device_id,)).fetchone()
+        if row is None:
+            return None
+        readings = np.frombuffer(row[1], dtype=READING_DTYPE)
+        return DeviceState(device_id, json.loads(row[0]) if row[0] else None, SensorRing(self.history, readings))
+
+    def _load_from_disk(self, device_id: str) -> Optional[DeviceState]:
+        with sqlite3.connect(self.path) as db:
+            return self._read_row(db, device_id)
+
+    def _update_on_disk(self, device_id: str, farm_info: Optional[dict], readings: List[dict]) -> DeviceState:
+        """Merge the update into the stored row, holding SQLite's write lock from the read to the write."""
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                state = self._read_row(db, device_id) or DeviceState(device_id, None, SensorRing(self.history))
+                if farm_info is not None:
+                    state.farm_info = farm_info
+                if state.readings.append(readings) or farm_info is not None:
+                    db.execute(
+                        "INSERT OR REPLACE INTO devices (device_id, farm_info, readings) VALUES (?, ?, ?)",
+                        (
+                            device_id,
+                            json.dumps(state.farm_info) if state.farm_info is not None else None,
+                            state.readings.array().tobytes(),
+                        ),
+                    )
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        finally:
+            db.close()
+        return state
+
+    def _remember(self, state: DeviceState):
+        self._devices[state.device_id] = state
+        self._devices.move_to_end(state.device_id)
+        while len(self._devices) > self.max_devices:
+            self._devices.popitem(last=False)
+
+    async def get(self, device_id: str) -> Optional[DeviceState]:
+        state = self._devices.get(device_id)
+        if state is None and self.path:
+            state = await asyncio.to_thread(self._load_from_disk, device_id)
+            if state is not None:
+                self._remember(state)
+        elif state is not None:
+            self._devices.move_to_end(device_id)
+        return state
+
+    async def update(self, device_id: str, farm_info: Optional[dict] = None, readings: List[dict] = ()) -> DeviceState:
+        """Merge a profile update and new readings into the device's state and persist it."""
+        lock, users = self._locks.get(device_id, (None, 0))
+        lock = lock or asyncio.Lock()
+        self._locks[device_id] = (lock, users + 1)
+        try:
+            async with lock:
+                if self.path:
+                    # SQLite holds the latest state, which another process may have changed
+                    state = await asyncio.to_thread(self._update_on_disk, device_id, farm_info, list(readings))
+                    self._remember(state)
+                else:
+                    state = await self.get(device_id)
+                    if state is None:
+                        state = DeviceState(device_id, None, SensorRing(self.history))
+                        self._remember(state)
+                    if farm_info is not None:
+                        state.farm_info = farm_info
+                    state.readings.append(list(readings))
+        finally:
+            lock, users = self._locks[device_id]
+            if users == 1:
+                del self._locks[device_id]
+            else:
+                self._locks[device_id] = (lock, users - 1)
+        return state
+
+    def stats(self) -> dict:
+        return {"devices": len(self._devices), "history": self.history}
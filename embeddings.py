@@ -0,0 +1,382 @@
+"""
+Embedding model handling.
+
+Importing torch and loading MiniLM takes several seconds, so the model is not
+loaded at import time. `EmbeddingModel` loads it on a background thread (or on
+first use) and lets async callers wait for it with a timeout.
+
+The model runs on one of the `BACKENDS`. All of them produce the same
+normalized, mean-pooled vectors:
+- torch: the PyTorch SentenceTransformer;
+- torch-int8: the same model with its Linear layers dynamically quantized to
+  int8;
+- onnx: the ONNX export run by ONNX Runtime with the `tokenizers` tokenizer,
+  without importing torch at all;
+- onnx-int8: that export's dynamically quantized int8 variant.
+
+`EmbeddingBatcher` collects texts from concurrent requests and encodes them
+in one batch, which is far cheaper per text than encoding them one by one.
+
+`EmbeddingCache` remembers vectors by a hash of the normalized query text, so
+devices resending unchanged readings never hit the model.
+"""
+import asyncio
+import hashlib
+import importlib.util
+import os
+import platform
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class ModelNotReady(Exception):
+    """Raised when the embedding model is still loading after the caller's wait."""
+
+
+def limit_torch_threads(threads: Optional[int]):
+    """Cap torch's intra-op thread pool in this process (no-op without torch or a thread count)."""
+    if not threads:
+        return
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+
+
+def _load_torch(model_name: str, threads: Optional[int]):
+    from sentence_transformers import SentenceTransformer
+
+    limit_torch_threads(threads)
+    return SentenceTransformer(model_name)
+
+
+def _load_torch_int8(model_name: str, threads: Optional[int]):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    limit_torch_threads(threads)
+    # Dynamically quantized layers only run on the CPU
+    model = SentenceTransformer(model_name, device="cpu")
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def _default_int8_file() -> str:
+    # Exports published with the model, quantized for the instruction set at hand
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "onnx/model_qint8_arm64.onnx"
+    return "onnx/model_quint8_avx2.onnx"
+
+
+class OnnxEncoder:
+    """
+    Sentence embeddings from a model's ONNX export: mean pooling over the
+    attention mask followed by L2 normalization, as in the MiniLM
+    SentenceTransformer pipeline.
+
+    The ONNX Runtime session is created on first use in each process. Its
+    thread pool does not survive a fork, so a master that preloads the model
+    (prefork.py) only downloads the files and reads the tokenizer.
+    """
+
+    def __init__(self, model_name: str, file_name: str, threads: Optional[int] = None, max_length: int = 256):
+        from huggingface_hub import hf_hub_download
+        from tokenizers import Tokenizer
+
+        self.model_path = hf_hub_download(model_name, file_name)
+        self.tokenizer = Tokenizer.from_file(hf_hub_download(model_name, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+        self.threads = threads
+        self._session = None
+        self._session_pid: Optional[int] = None
+        self._session_lock = threading.Lock()
+
+    def session(self):
+        with self._session_lock:
+            if self._session is None or self._session_pid != os.getpid():
+                import onnxruntime
+
+                options = onnxruntime.SessionOptions()
+                if self.threads:
+                    options.intra_op_num_threads = self.threads
+                self._session = onnxruntime.InferenceSession(
+                    self.model_path, options, providers=["CPUExecutionProvider"]
+                )
+                self._session_pid = os.getpid()
+            return self._session
+
+    def encode(self, sentences, batch_size: int = 32, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        session = self.session()
+        inputs = {entry.name for entry in session.get_inputs()}
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+            feed = {
+                "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+                "attention_mask": mask,
+                "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+            }
+            hidden = session.run(None, {name: value for name, value in feed.items() if name in inputs})[0]
+            weights = mask[..., None].astype(np.float32)
+            pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32))
+        vectors = np.concatenate(batches) if batches else np.zeros((0, 0), dtype=np.float32)
+        return vectors[0] if single else vectors
+
+
+def _load_onnx(model_name: str, threads: Optional[int]):
+    return OnnxEncoder(model_name, os.getenv("EMBEDDING_ONNX_FILE") or "onnx/model.onnx", threads)
+
+
+def _load_onnx_int8(model_name: str, threads: Optional[int]):
+    return OnnxEncoder(model_name, os.getenv("EMBEDDING_ONNX_FILE") or _default_int8_file(), threads)
+
+
+BACKENDS: Dict[str, Callable[[str, Optional[int]], object]] = {
+    "torch": _load_torch,
+    "torch-int8": _load_torch_int8,
+    "onnx": _load_onnx,
+    "onnx-int8": _load_onnx_int8,
+}
+# Modules each backend imports when it loads, checked up front so a misconfiguration fails at startup
+BACKEND_MODULES: Dict[str, Tuple[str, ...]] = {
+    "torch": ("sentence_transformers",),
+    "torch-int8": ("torch", "sentence_transformers"),
+    "onnx": ("onnxruntime", "tokenizers", "huggingface_hub"),
+    "onnx-int8": ("onnxruntime", "tokenizers", "huggingface_hub"),
+}
+
+
+def check_backend(backend: str):
+    """Raise if `backend` is unknown or a module it needs is not installed."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    missing = [
+        module for module in BACKEND_MODULES[backend]
+        if module not in sys.modules and importlib.util.find_spec(module) is None
+    ]
+    if missing:
+        raise ImportError(f"Embedding backend '{backend}' needs {', '.join(missing)} installed (see requirements.txt)")
+
+
+def load_backend(backend: str, model_name: str, threads: Optional[int] = None):
+    """Load `model_name` on `backend`; the result has a SentenceTransformer-style `encode`."""
+    check_backend(backend)
+    return BACKENDS[backend](model_name, threads)
+
+
+class EmbeddingModel:
+    def __init__(self, model_name: str, backend: str = "torch", threads: Optional[int] = None):
+        check_backend(backend)
+        self.model_name = model_name
+        self.backend = backend
+        self.threads = threads
+        self.load_seconds: Optional[float] = None
+        self._model = None
+        self._error: Optional[BaseException] = None
+        self._loaded = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    @property
+    def ready(self) -> bool:
+        return self._model is not None
+
+    @property
+    def status(self) -> str:
+        if self._model is not None:
+            return "loaded"
+        if self._error is not None:
+            return "failed"
+        return "loading" if self._thread is not None else "not-started"
+
+    def start(self):
+        """Start loading the model in the background; safe to call repeatedly."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name="embedding-loader", daemon=True)
+                self._thread.start()
+
+    def _load(self):
+        started = time.perf_counter()
+        try:
+            self._model = load_backend(self.backend, self.model_name, self.threads)
+        except BaseException as e:
+            self._error = e
+        finally:
+            self.load_seconds = time.perf_counter() - started
+            with self._lock:
+                self._loaded.set()
+                waiters, self._waiters = self._waiters, []
+            for loop, future in waiters:
+                loop.call_soon_threadsafe(_resolve, future)
+
+    def load(self):
+        """Block until the model is loaded and return it."""
+        self.start()
+        self._loaded.wait()
+        if self._error is not None:
+            raise RuntimeError(f"Embedding model failed to load: {self._error}") from self._error
+        return self._model
+
+    async def wait(self, timeout: Optional[float] = None):
+        """Wait without blocking the event loop until the model is loaded."""
+        self.start()
+        with self._lock:
+            if not self._loaded.is_set():
+                loop = asyncio.get_running_loop()
+                future = loop.create_future()
+                self._waiters.append((loop, future))
+            else:
+                future = None
+        if future is not None:
+            try:
+                await asyncio.wait_for(future, timeout=timeout)
+            except asyncio.TimeoutError:
+                raise ModelNotReady(f"Embedding model still loading after {timeout:.0f}s") from None
+        return self.load()
+
+    def encode(self, sentences, **kwargs):
+        return self.load().encode(sentences, **kwargs)
+
+
+class EmbeddingBatcher:
+    """
+    Dynamic micro-batcher in front of an embedding model.
+
+    Texts are queued and flushed as a single `encode` call once `max_batch_size`
+    texts are waiting or the oldest one has waited `max_wait` seconds.
+    """
+
+    def __init__(self, model: EmbeddingModel, executor: Executor, max_batch_size: int = 32, max_wait: float = 0.005):
+        self.model = model
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running = set()
+        self.batches = 0
+        self.texts = 0
+
+    async def encode(self, text: str) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[: self.max_batch_size], self._pending[self.max_batch_size :]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        if batch:
+            task = asyncio.ensure_future(self._encode_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _encode_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        texts = [text for text, _ in batch]
+        self.batches += 1
+        self.texts += len(texts)
+        try:
+            loop = asyncio.get_running_loop()
+            vectors = await loop.run_in_executor(self.executor, self.model.encode, texts)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+
+class EmbeddingCache:
+    """LRU of float32 vectors keyed by a hash of the normalized text, optionally backed by SQLite."""
+
+    def __init__(self, max_entries: int = 4096, path: Optional[str] = None, namespace: str = ""):
+        self.max_entries = max_entries
+        self.path = path
+        # Keeps vectors from different backends apart in a shared SQLite file
+        self.namespace = namespace
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path:
+            with sqlite3.connect(path) as db:
+                db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+
+    def key(self, text: str) -> str:
+        normalized = " ".join(text.split()).lower()
+        if self.namespace:
+            normalized = f"{self.namespace}\0{normalized}"
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load_from_disk(self, key: str) -> Optional[np.ndarray]:
+        with sqlite3.connect(self.path) as db:
+            row = db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        return np.frombuffer(row[0], dtype=np.float32) if row else None
+
+    def _save_to_disk(self, key: str, vector: np.ndarray):
+        with sqlite3.connect(self.path) as db:
+            db.execute("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", (key, vector.tobytes()))
+
+    async def get(self, text: str) -> Optional[np.ndarray]:
+        key = self.key(text)
+        vector = self._entries.get(key)
+        if vector is None and self.path:
+            vector = await asyncio.to_thread(self._load_from_disk, key)
+            if vector is not None:
+                self._remember(key, vector)
+        if vector is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return vector
+
+    async def put(self, text: str, vector: np.ndarray):
+        key = self.key(text)
+        vector = np.asarray(vector, dtype=np.float32)
+        self._remember(key, vector)
+        if self.path:
+            await asyncio.to_thread(self._save_to_disk, key, vector)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "hitRatio": self.hit_ratio}
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,288 @@
+"""
+Background job queue for the long-running LLM endpoints.
+
+A submitted job gets an id right away and is executed later by one of a fixed
+number of worker tasks, so the request that created it does not hold a
+connection open for the weather + LLM chain. Workers always take the highest
+priority first. Within a priority they go round-robin over tenants, so one
+tenant's burst cannot starve the others.
+
+When a tenant resubmits a job identical to one of its own that is still
+queued or running, with the same callback URL, the existing job is returned
+instead of queueing the work twice. Other tenants and other callbacks get a
+job of their own, so every callback fires and every tenant's work counts
+towards its own fair share. Finished jobs are kept
+for `result_ttl` seconds for polling, and `notify` (e.g. a webhook) is called
+when each job finishes. `check_callback_url` keeps webhooks off loopback,
+private and other internal addresses. With a `path` jobs are also written to SQLite, so
+results survive restarts and jobs that were still pending are queued again
+on start.
+"""
+import asyncio
+import hashlib
+import ipaddress
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+from urllib.parse import urlsplit
+
+logger = logging.getLogger("agrisense")
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+Handler = Callable[[dict], Awaitable[Any]]
+
+
+class QueueFull(Exception):
+    """Raised when the number of pending jobs has reached the configured limit."""
+
+
+async def check_callback_url(url: str, allowed_hosts: Sequence[str] = ()):
+    """
+    Raise ValueError unless `url` is an http(s) URL the service may POST to.
+
+    With `allowed_hosts` the host must be one of them. Otherwise every address
+    the host resolves to must be public: loopback, private, link-local and
+    other reserved ranges are refused so callers cannot reach internal services.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("callback_url must be an http or https URL")
+    host = parts.hostname.lower()
+    if allowed_hosts:
+        if host not in allowed_hosts:
+            raise ValueError(f"callback_url host '{host}' is not allowed")
+        return
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port)
+    except (OSError, ValueError):
+        raise ValueError(f"callback_url host '{host}' could not be resolved") from None
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if not address.is_global:
+            raise ValueError(f"callback_url host '{host}' resolves to a non-public address")
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    tenant: str
+    priority: int
+    payload: dict
+    fingerprint: str
+    callback_url: Optional[str] = None
+    status: str = "queued"
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "jobId": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "priority": next(name for name, value in PRIORITIES.items() if value == self.priority),
+            "createdAt": self.created_at,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    def __init__(
+        self,
+        handlers: Dict[str, Handler],
+        workers: int = 4,
+        max_pending: int = 1000,
+        result_ttl: float = 3600,
+        path: Optional[str] = None,
+        notify: Optional[Callable[[Job], Awaitable[None]]] = None,
+    ):
+        self.handlers = handlers
+        self.workers = workers
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.path = path
+        self.notify = notify
+        self._jobs: Dict[str, Job] = {}
+        self._pending_by_fingerprint: Dict[str, Job] = {}
+        # priority -> tenant -> that tenant's queued jobs; tenant order is the round-robin order
+        self._queues: Dict[int, "OrderedDict[str, deque[Job]]"] = {}
+        self._available = asyncio.Semaphore(0)
+        self._workers: List[asyncio.Task] = []
+        self.submitted = 0
+        self.deduplicated = 0
+        self.succeeded = 0
+        self.failed = 0
+        if path:
+            with sqlite3.connect(path) as db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT, finished_at REAL, job TEXT)"
+                )
+
+    @staticmethod
+    def fingerprint(kind: str, payload: dict, tenant: str = "", callback_url: Optional[str] = None) -> str:
+        key = f"{kind}\0{tenant}\0{callback_url or ''}\0{json.dumps(payload, sort_keys=True)}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    @property
+    def queued(self) -> int:
+        return sum(len(jobs) for tenants in self._queues.values() for jobs in tenants.values())
+
+    def _save_to_disk(self, job: Job):
+        with sqlite3.connect(self.path) as db:
+            db.execute(
+                "INSERT OR REPLACE INTO jobs (id, status, finished_at, job) VALUES (?, ?, ?, ?)",
+                (job.id, job.status, job.finished_at, json.dumps(job.__dict__)),
+            )
+
+    def _load_from_disk(self, job_id: str) -> Optional[Job]:
+        with sqlite3.connect(self.path) as db:
+            row = db.execute("SELECT job FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job(**json.loads(row[0])) if row else None
+
+    def _load_pending_from_disk(self) -> List[Job]:
+        with sqlite3.connect(self.path) as db:
+            rows = db.execute("SELECT job FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        return [Job(**json.loads(row[0])) for row in rows]
+
+    def _prune_disk(self, before: float):
+        with sqlite3.connect(self.path) as db:
+            db.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (before,))
+
+    async def _persist(self, job: Job):
+        if self.path:
+            await asyncio.to_thread(self._save_to_disk, job)
+
+    def _enqueue(self, job: Job):
+        self._jobs[job.id] = job
+        self._pending_by_fingerprint[job.fingerprint] = job
+        tenants = self._queues.setdefault(job.priority, OrderedDict())
+        tenants.setdefault(job.tenant, deque()).append(job)
+        self._available.release()
+
+    def _next(self) -> Job:
+        for priority in sorted(self._queues):
+            tenants = self._queues[priority]
+            if not tenants:
+                continue
+            tenant, jobs = next(iter(tenants.items()))
+            job = jobs.popleft()
+            if jobs:
+                tenants.move_to_end(tenant)
+            else:
+                del tenants[tenant]
+            return job
+        raise RuntimeError("job queue signalled work but every queue is empty")
+
+    def _prune(self):
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def submit(
+        self,
+        kind: str,
+        payload: dict,
+        tenant: str,
+        priority: str = "normal",
+        callback_url: Optional[str] = None,
+    ) -> Job:
+        """Queue a job, or return the tenant's identical job that is already queued or running."""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}', expected one of {', '.join(PRIORITIES)}")
+        fingerprint = self.fingerprint(kind, payload, tenant, callback_url)
+        existing = self._pending_by_fingerprint.get(fingerprint)
+        if existing is not None:
+            self.deduplicated += 1
+            return existing
+        if self.queued >= self.max_pending:
+            raise QueueFull(f"{self.queued} jobs are already queued")
+
+        self._prune()
+        job = Job(
+            id=uuid.uuid4().hex,
+            kind=kind,
+            tenant=tenant,
+            priority=PRIORITIES[priority],
+            payload=payload,
+            fingerprint=fingerprint,
+            callback_url=callback_url,
+        )
+        self.submitted += 1
+        self._enqueue(job)
+        await self._persist(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is None and self.path:
+            job = await asyncio.to_thread(self._load_from_disk, job_id)
+        return job
+
+    async def _run(self, job: Job):
+        job.status = "running"
+        job.started_at = time.time()
+        await self._persist(job)
+        try:
+            job.result = await self.handlers[job.kind](job.payload)
+            job.status = "succeeded"
+            self.succeeded += 1
+        except Exception as e:
+            job.status = "failed"
+            job.error = getattr(e, "detail", None) or str(e) or type(e).__name__
+            self.failed += 1
+            logger.warning("job %s (%s) failed: %s", job.id, job.kind, job.error)
+        # A worker cancelled mid-job (shutdown) leaves it running on disk, so the next start re-queues it
+        job.finished_at = time.time()
+        self._pending_by_fingerprint.pop(job.fingerprint, None)
+        await self._persist(job)
+        if self.notify is not None and job.callback_url:
+            try:
+                await self.notify(job)
+            except Exception as e:
+                logger.warning("job %s callback to %s failed: %s", job.id, job.callback_url, e)
+
+    async def _work(self):
+        while True:
+            await self._available.acquire()
+            await self._run(self._next())
+
+    async def start(self, recover: bool = True):
+        """Start the workers, first re-queueing jobs a previous process left unfinished if `recover`."""
+        if self.path and recover:
+            await asyncio.to_thread(self._prune_disk, time.time() - self.result_ttl)
+            for job in await asyncio.to_thread(self._load_pending_from_disk):
+                job.status = "queued"
+                self._enqueue(job)
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queued,
+            "running": sum(1 for job in self._pending_by_fingerprint.values() if job.status == "running"),
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+        }
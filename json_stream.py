@@ -0,0 +1,124 @@
+"""
+Incremental JSON scanner for streamed LLM output.
+
+`JsonStreamParser` is fed text chunks as they arrive and yields every array
+element as soon as its closing character has been seen, together with the
+key of the object field holding the array. For `{"tasks": [{...}, {...}]}`
+it yields `("tasks", {...})` once per task, long before the document ends.
+Passing `fields` restricts capture to arrays held by those keys (`None` meaning
+a top-level array), so the scanner descends into other containers instead.
+Only the element currently being captured is buffered, and every character
+is looked at exactly once.
+"""
+import json
+from typing import Any, Iterable, List, Optional, Tuple
+
+
+class _Frame:
+    __slots__ = ("kind", "name", "key", "expecting_key")
+
+    def __init__(self, kind: str, name: Optional[str]):
+        self.kind = kind
+        # Key of the object field this container is the value of (inherited through nested arrays)
+        self.name = name
+        self.key: Optional[str] = None
+        self.expecting_key = kind == "{"
+
+
+class JsonStreamParser:
+    def __init__(self, fields: Optional[Iterable[Optional[str]]] = None):
+        self.fields = set(fields) if fields is not None else None
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._key_chars: Optional[List[str]] = None
+        self._capture: Optional[List[str]] = None
+        self._capture_depth = 0
+        self._capture_name: Optional[str] = None
+        self._capture_is_string = False
+
+    @property
+    def depth(self) -> int:
+        return len(self._stack)
+
+    def _captures(self, frame: Optional[_Frame]) -> bool:
+        return (
+            self._capture is None
+            and frame is not None
+            and frame.kind == "["
+            and (self.fields is None or frame.name in self.fields)
+        )
+
+    def _start_capture(self, is_string: bool):
+        parent = self._stack[-1]
+        self._capture = []
+        self._capture_depth = len(self._stack)
+        self._capture_name = parent.name
+        self._capture_is_string = is_string
+
+    def _finish_capture(self, elements: List[Tuple[Optional[str], Any]]):
+        try:
+            elements.append((self._capture_name, json.loads("".join(self._capture))))
+        except json.JSONDecodeError:
+            pass
+        self._capture = None
+
+    def feed(self, chunk: str) -> List[Tuple[Optional[str], Any]]:
+        """Consume `chunk` and return the array elements it completed as `(field, value)` pairs."""
+        elements: List[Tuple[Optional[str], Any]] = []
+        for char in chunk:
+            capture = self._capture
+            if capture is not None:
+                capture.append(char)
+
+            if self._in_string:
+                if self._key_chars is not None and not (char == '"' and not self._escape):
+                    self._key_chars.append(char)
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._key_chars is not None:
+                        raw_key = "".join(self._key_chars)
+                        try:
+                            self._stack[-1].key = json.loads('"' + raw_key + '"')
+                        except json.JSONDecodeError:
+                            self._stack[-1].key = raw_key
+                        self._key_chars = None
+                    elif capture is not None and self._capture_is_string and len(self._stack) == self._capture_depth:
+                        self._finish_capture(elements)
+                continue
+
+            top = self._stack[-1] if self._stack else None
+            if char == '"':
+                self._in_string = True
+                if top is not None and top.kind == "{" and top.expecting_key:
+                    self._key_chars = []
+                elif self._captures(top):
+                    self._start_capture(is_string=True)
+                    self._capture.append(char)
+            elif char in "{[":
+                if self._captures(top):
+                    self._start_capture(is_string=False)
+                    self._capture.append(char)
+                if top is None:
+                    name = None
+                elif top.kind == "{":
+                    name = top.key
+                else:
+                    name = top.name
+                self._stack.append(_Frame(char, name))
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if capture is not None and len(self._stack) == self._capture_depth:
+                    self._finish_capture(elements)
+            elif char == ":":
+                if top is not None and top.kind == "{":
+                    top.expecting_key = False
+            elif char == ",":
+                if top is not None and top.kind == "{":
+                    top.expecting_key = True
+        return elements
@@ -0,0 +1,109 @@
+"""
+Result cache for the LLM endpoints.
+
+Entries are keyed by a hash of the model and the exact prompt text, which is a
+canonical fingerprint of everything that reaches the LLM (farm profile, sensor
+summary, forecast cell, advisories, tasks, retrieval context). Each endpoint
+has its own TTL, identical concurrent requests share a single LLM call, and
+entries are tagged with the device id so they can be invalidated when the
+device's advisories or tasks change.
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        ttls: Dict[str, float],
+        max_entries: int = 2048,
+        dependents: Optional[Dict[str, Sequence[str]]] = None,
+    ):
+        self.ttls = ttls
+        self.max_entries = max_entries
+        # Endpoint -> endpoints whose cached results go stale when it produces a fresh result
+        self.dependents = dependents or {}
+        self._entries: "OrderedDict[str, tuple[float, str, str, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def fingerprint(endpoint: str, model: str, prompt: str) -> str:
+        digest = hashlib.sha256()
+        for part in (endpoint, model, prompt):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _lookup(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, _, _, result = entry
+        if time.monotonic() > expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def _store(self, key: str, endpoint: str, device_id: str, result: Any):
+        self._entries[key] = (time.monotonic() + self.ttls.get(endpoint, 0), endpoint, device_id, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        if endpoint in self.dependents:
+            self.invalidate(device_id, self.dependents[endpoint])
+
+    def invalidate(self, device_id: str, endpoints: Optional[Sequence[str]] = None) -> int:
+        """Drop cached results for a device, optionally only for some endpoints."""
+        stale = [
+            key for key, (_, endpoint, owner, _) in self._entries.items()
+            if owner == device_id and (endpoints is None or endpoint in endpoints)
+        ]
+        for key in stale:
+            del self._entries[key]
+        return len(stale)
+
+    async def get_or_compute(
+        self,
+        endpoint: str,
+        model: str,
+        prompt: str,
+        device_id: str,
+        compute: Callable[[], Awaitable[Any]],
+        cacheable: Callable[[Any], bool] = bool,
+    ) -> Any:
+        """Return a cached result for this prompt, or compute it once for all concurrent callers."""
+        if self.ttls.get(endpoint, 0) <= 0:
+            return await compute()
+
+        key = self.fingerprint(endpoint, model, prompt)
+        result = self._lookup(key)
+        if result is not None:
+            self.hits += 1
+            return result
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+
+            async def run():
+                result = await compute()
+                if cacheable(result):
+                    self._store(key, endpoint, device_id, result)
+                return result
+
+            task = asyncio.create_task(run())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
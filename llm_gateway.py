@@ -0,0 +1,201 @@
+"""
+Admission control for calls to the LLM provider.
+
+Every LLM call reserves a slot through `LLMGateway`. A reservation does three
+things:
+- It waits for one of `limit` concurrency slots. Waiters are woken in
+  priority order, so interactive requests go ahead of batch and report work.
+- It waits out any provider-requested pause.
+- It takes the call's estimated tokens from a tokens-per-minute bucket.
+
+The limit adapts AIMD-style. It grows by about one slot per window of
+successful calls, and is cut multiplicatively (at most once per
+`decrease_interval`) when the provider rate-limits. The `retry-after` delay
+of a rate-limit response pauses all new calls, not just the one that got it,
+so a burst settles just under the provider's ceiling instead of hammering it
+into errors.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar
+
+logger = logging.getLogger("agrisense")
+
+T = TypeVar("T")
+
+INTERACTIVE = 0
+REPORT = 1
+BACKGROUND = 2
+
+
+class RateLimited(Exception):
+    """Raised when a call is still rate-limited after the gateway's retries."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM provider is rate limiting, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, tokens_per_minute: float):
+        self.capacity = tokens_per_minute
+        self.rate = tokens_per_minute / 60
+        self.tokens = tokens_per_minute
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def take(self, tokens: float):
+        # A single call larger than the bucket would never fit; let it through once the bucket is full
+        tokens = min(tokens, self.capacity)
+        self._refill()
+        while self.tokens < tokens:
+            await asyncio.sleep((tokens - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= tokens
+
+    def credit(self, tokens: float):
+        """Return tokens that were reserved but not used (or charge more when `tokens` is negative)."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + tokens)
+
+
+class Reservation:
+    def __init__(self, gateway: "LLMGateway", tokens: int):
+        self.gateway = gateway
+        self.tokens = tokens
+
+    def used(self, tokens: Optional[int]):
+        """Settle the token bucket with the usage the provider reported."""
+        if tokens is not None and self.gateway.bucket is not None:
+            self.gateway.bucket.credit(self.tokens - tokens)
+            self.tokens = tokens
+
+    async def __aenter__(self) -> "Reservation":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.gateway._release(exc)
+
+
+class LLMGateway:
+    def __init__(
+        self,
+        initial_limit: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        tokens_per_minute: Optional[float] = None,
+        backoff: float = 0.5,
+        decrease_interval: float = 1.0,
+        max_retries: int = 3,
+        max_retry_after: float = 60,
+        retry_after: Callable[[BaseException], Optional[float]] = lambda error: None,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.backoff = backoff
+        self.decrease_interval = decrease_interval
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        # Returns the delay the provider asked for when `error` is a rate-limit response, else None
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._decreased_at = 0.0
+        self.completed = 0
+        self.rate_limited = 0
+        self.retries = 0
+
+    def _admit(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    async def _acquire_slot(self, priority: int):
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+        # Admits this waiter straight away if slots are free and nothing more urgent is waiting
+        self._admit()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Admitted just as we were cancelled: hand the slot on
+                self.in_flight -= 1
+                self._admit()
+            raise
+
+    def _release(self, error: Optional[BaseException]):
+        self.in_flight -= 1
+        delay = self.retry_after(error) if error is not None else None
+        if delay is not None:
+            self.rate_limited += 1
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + min(delay, self.max_retry_after))
+            # Calls already in flight fail together; count them as one congestion signal
+            if now - self._decreased_at >= self.decrease_interval:
+                self._decreased_at = now
+                self.limit = max(self.min_limit, self.limit / 2)
+                logger.info("LLM rate limited, concurrency limit cut to %d", int(self.limit))
+        elif error is None:
+            self.completed += 1
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._admit()
+
+    async def reserve(self, priority: int, tokens: int) -> Reservation:
+        """Wait for a slot, any provider pause and enough token budget; use the result as `async with`."""
+        await self._acquire_slot(priority)
+        try:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            if self.bucket is not None:
+                await self.bucket.take(tokens)
+        except BaseException:
+            self.in_flight -= 1
+            self._admit()
+            raise
+        return Reservation(self, tokens)
+
+    async def call(self, priority: int, tokens: int, request: Callable[[Reservation], Awaitable[T]]) -> T:
+        """Run `request(reservation)` under a reservation, retrying rate-limited attempts."""
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += 1
+            try:
+                async with await self.reserve(priority, tokens) as reservation:
+                    return await request(reservation)
+            except Exception as e:
+                delay = self.retry_after(e)
+                if delay is None:
+                    raise
+                if attempt == self.max_retries:
+                    raise RateLimited(delay) from e
+                # The next reservation waits out the pause; back off a little more on repeated hits
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "inFlight": self.in_flight,
+            "waiting": len(self._waiters),
+            "completed": self.completed,
+            "rateLimited": self.rate_limited,
+            "retries": self.retries,
+            "tokensAvailable": int(self.bucket.tokens) if self.bucket is not None else None,
+        }
@@ -0,0 +1,267 @@
+"""
+Parsing and validation of the JSON the LLM endpoints get back from the model.
+
+`scan_json` walks the completion once, picking out every top-level JSON value
+embedded in it (so code fences and stray prose around the JSON do not
+matter) and repairing the two mistakes models make most: trailing commas and
+output cut off at `max_tokens`, which is closed after the last complete
+element. `OutputSpec` describes where an endpoint's items live and the Pydantic
+model each item must satisfy; `StructuredOutput` runs a completion through
+both, asks the model again (a bounded number of times) when nothing usable
+came back, and keeps per-endpoint parse metrics.
+"""
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Type, Union
+
+from pydantic import BaseModel, ConfigDict, ValidationError, field_validator
+
+logger = logging.getLogger("agrisense")
+
+CLOSERS = {"{": "}", "[": "]"}
+
+
+class AdvisoryOutput(BaseModel):
+    title: str
+    precaution: str
+    risk_factors: str
+    recommended_action: str
+
+
+class TaskOutput(BaseModel):
+    taskTitle: str
+    taskDescription: str
+    taskSeverity: str
+    deadliestDeadline: str
+
+    @field_validator("taskSeverity")
+    @classmethod
+    def known_severity(cls, value: str) -> str:
+        value = value.strip().upper()
+        if value not in ("HIGH", "MEDIUM", "LOW"):
+            raise ValueError("taskSeverity must be HIGH, MEDIUM or LOW")
+        return value
+
+
+class TaskUpdate(BaseModel):
+    # Only the modified fields are returned, so anything besides id and notes is passed through
+    model_config = ConfigDict(extra="allow")
+
+    id: Union[int, str]
+    notes: str
+
+
+class WeeklySummary(BaseModel):
+    farm_health: List[str]
+    risk_analysis: List[str]
+    yield_forecast: List[str]
+
+
+def scan_json(text: str) -> Tuple[List[Any], bool]:
+    """
+    Return the top-level JSON objects and arrays embedded in `text`, and whether any had to be repaired.
+
+    Text outside JSON values is skipped. Trailing commas are dropped, and a value
+    left open at the end of the text is closed right after its last complete element.
+    """
+    values: List[Any] = []
+    repaired = False
+    buffer: List[str] = []
+    stack: List[str] = []
+    in_string = escape = False
+    pending_comma: Optional[int] = None
+    # Buffer length and open containers right after the last closed nested value
+    checkpoint: Optional[Tuple[int, Tuple[str, ...]]] = None
+
+    for char in text:
+        if not stack:
+            if char in CLOSERS:
+                buffer, stack, pending_comma, checkpoint = [char], [CLOSERS[char]], None, None
+            continue
+
+        buffer.append(char)
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in CLOSERS:
+            stack.append(CLOSERS[char])
+        elif char in "}]":
+            if pending_comma is not None:
+                buffer[pending_comma] = ""
+                repaired = True
+            stack.pop()
+            if stack:
+                checkpoint = (len(buffer), tuple(stack))
+            else:
+                try:
+                    values.append(json.loads("".join(buffer)))
+                except json.JSONDecodeError:
+                    pass
+        elif char == ",":
+            pending_comma = len(buffer) - 1
+            continue
+        if not char.isspace():
+            pending_comma = None
+
+    if stack and checkpoint is not None:
+        length, open_containers = checkpoint
+        try:
+            values.append(json.loads("".join(buffer[:length]) + "".join(reversed(open_containers))))
+            repaired = True
+        except json.JSONDecodeError:
+            pass
+    return values, repaired
+
+
+@dataclass
+class OutputSpec:
+    """Where an endpoint's items live in the model's JSON and what each item must look like."""
+
+    key: str
+    model: Type[BaseModel]
+    # Object keys that may hold the item array, besides `key` itself
+    aliases: Tuple[str, ...] = ()
+
+    def candidates(self, value: Any) -> Optional[list]:
+        """The raw items a parsed JSON value holds, or None when it holds none of this shape."""
+        if isinstance(value, list):
+            return value
+        if not isinstance(value, dict):
+            return None
+        for name in (self.key,) + self.aliases:
+            if isinstance(value.get(name), list):
+                return value[name]
+        lists = [item for item in value.values() if isinstance(item, list)]
+        if len(lists) == 1 and all(isinstance(item, dict) for item in lists[0]):
+            return lists[0]
+        return [value]
+
+
+@dataclass
+class ParseResult:
+    items: List[BaseModel]
+    found: bool
+    invalid: int
+    repaired: bool
+
+    @property
+    def ok(self) -> bool:
+        # An empty array is a valid answer (e.g. no task needs updating); all-invalid items are not
+        return self.found and (bool(self.items) or not self.invalid)
+
+
+def parse_output(spec: OutputSpec, text: str) -> ParseResult:
+    values, repaired = scan_json(text)
+    items: List[BaseModel] = []
+    found = False
+    invalid = 0
+    for value in values:
+        candidates = spec.candidates(value)
+        if candidates is None:
+            continue
+        found = True
+        for candidate in candidates:
+            try:
+                items.append(spec.model.model_validate(candidate))
+            except ValidationError:
+                invalid += 1
+    return ParseResult(items=items, found=found, invalid=invalid, repaired=repaired)
+
+
+class ParseMetrics:
+    __slots__ = ("responses", "parsed", "repaired", "retries", "failed", "invalid_items")
+
+    def __init__(self):
+        self.responses = 0
+        self.parsed = 0
+        self.repaired = 0
+        self.retries = 0
+        self.failed = 0
+        self.invalid_items = 0
+
+    def record(self, result: ParseResult):
+        self.responses += 1
+        self.invalid_items += result.invalid
+        if result.ok:
+            self.parsed += 1
+            self.repaired += result.repaired
+
+    @property
+    def success_rate(self) -> Optional[float]:
+        return self.parsed / self.responses if self.responses else None
+
+    def stats(self) -> dict:
+        return {
+            "responses": self.responses,
+            "parsed": self.parsed,
+            "repaired": self.repaired,
+            "retries": self.retries,
+            "failed": self.failed,
+            "invalidItems": self.invalid_items,
+            "successRate": self.success_rate,
+        }
+
+
+class StructuredOutput:
+    def __init__(self, retries: int = 1, observe_parse: Optional[Callable[[float], None]] = None):
+        self.retries = retries
+        # Called with the seconds each parse took, for latency instrumentation
+        self.observe_parse = observe_parse
+        self.metrics: Dict[str, ParseMetrics] = {}
+
+    @staticmethod
+    def correction(spec: OutputSpec, result: ParseResult) -> str:
+        problem = f"{result.invalid} item(s) were missing required fields" if result.found else "it was not valid JSON"
+        fields = ", ".join(spec.model.model_fields)
+        return (
+            f"Your previous reply could not be used because {problem}. Reply again with only a JSON object "
+            f'with a "{spec.key}" array whose items have the fields: {fields}.'
+        )
+
+    async def generate(
+        self,
+        endpoint: str,
+        spec: OutputSpec,
+        prompt: str,
+        complete: Callable[[List[dict]], Awaitable[Optional[str]]],
+    ) -> List[BaseModel]:
+        """
+        Ask `complete(messages)` for a completion and return its validated items.
+
+        When a completion yields nothing usable the model is shown its reply and asked
+        again, at most `retries` times. Items that fail validation are dropped.
+        """
+        metrics = self.metrics.setdefault(endpoint, ParseMetrics())
+        messages = [{"role": "user", "content": prompt}]
+        for attempt in range(self.retries + 1):
+            if attempt:
+                metrics.retries += 1
+            content = await complete(messages) or ""
+            started = time.perf_counter()
+            result = parse_output(spec, content)
+            if self.observe_parse is not None:
+                self.observe_parse(time.perf_counter() - started)
+            metrics.record(result)
+            if result.ok:
+                return result.items
+            logger.debug("%s output unusable (attempt %d): %.200s", endpoint, attempt + 1, content)
+            messages = messages[:1] + [
+                {"role": "assistant", "content": content},
+                {"role": "user", "content": self.correction(spec, result)},
+            ]
+        metrics.failed += 1
+        logger.warning("%s output still unusable after %d attempts", endpoint, self.retries + 1)
+        return []
+
+    def stats(self) -> dict:
+        return {endpoint: metrics.stats() for endpoint, metrics in self.metrics.items()}
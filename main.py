@@ -1,37 +1,344 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List
-import requests
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Sequence
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import httpx
 import json
+import logging
 import uvicorn
-import qdrant_client
-from groq import Groq
+from contextvars import ContextVar
+from groq import AsyncGroq, RateLimitError
+from qdrant_client import AsyncQdrantClient
 from qdrant_client.models import PointStruct
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from typing import List
 import os
 from dotenv import load_dotenv
+from change_gate import ChangeGate
+from device_state import DeviceStateStore
+from embeddings import EmbeddingBatcher, EmbeddingCache, EmbeddingModel, ModelNotReady
+from jobs import JobQueue, QueueFull, check_callback_url
+from json_stream import JsonStreamParser
+from metrics import Registry
+from llm_cache import ResponseCache
+from llm_gateway import BACKGROUND, INTERACTIVE, REPORT, LLMGateway, RateLimited
+from llm_output import (
+    AdvisoryOutput,
+    OutputSpec,
+    StructuredOutput,
+    TaskOutput,
+    TaskUpdate,
+    WeeklySummary,
+)
+from pipeline import PipelineRun, Stage, run_stages
+from retrieval import AdvisoryRetriever, LocalVectorIndex
+from rules import DEFAULT_RANGES, RangeTable, RuleEngine, template_advisories, template_tasks
+from prompts import (
+    Prompt,
+    build_prompt,
+    compact_json,
+    estimate_tokens,
+    farm_profile,
+    records_renderings,
+    retrieval_renderings,
+    sensor_renderings,
+    weather_renderings,
+)
+from sensor_summary import describe, summarize
+from task_triage import Triage, merge_duplicates, task_text, triage_tasks
+from weather import CircuitBreaker, ForecastCache, WeatherClient, WeatherUnavailable
 
 load_dotenv()  
 
-# Initialize FastAPI
-app = FastAPI()
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 QDRANT_URL = os.getenv("QDRANT_URL")
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
+WEATHER_BASE_URL = os.getenv("WEATHER_BASE_URL", "https://weather.visualcrossing.com")
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "2"))
+
+# Per-stage timeouts (seconds) for the request pipeline
+WEATHER_STAGE_TIMEOUT = float(os.getenv("WEATHER_STAGE_TIMEOUT", "10"))
+RETRIEVAL_STAGE_TIMEOUT = float(os.getenv("RETRIEVAL_STAGE_TIMEOUT", "5"))
+LLM_STAGE_TIMEOUT = float(os.getenv("LLM_STAGE_TIMEOUT", "60"))
+
+LLM_MODEL = os.getenv("LLM_MODEL", "meta-llama/llama-4-scout-17b-16e-instruct")
+LLM_MAX_TOKENS = 1024
+
+# /events and /generate-tasks answer from templates, without the LLM, when every recent reading and
+# forecast day is inside the crop's ideal range (RULES_PATH: JSON range table replacing the built-in one)
+RULES_FAST_PATH = os.getenv("RULES_FAST_PATH", "1") == "1"
+rule_engine = RuleEngine(
+    RangeTable.from_file(os.environ["RULES_PATH"]) if os.getenv("RULES_PATH") else RangeTable(DEFAULT_RANGES),
+    margin=float(os.getenv("RULES_MARGIN", "0.1")),
+    window_hours=float(os.getenv("RULES_WINDOW_HOURS", "48")),
+)
+
+# A device's previous result is returned (marked "recomputed": false) until its readings or forecast move by
+# more than the per-metric tolerances, its other inputs change, CHANGE_GATE_MAX_AGE passes or ?refresh=true is sent
+CHANGE_GATE = os.getenv("CHANGE_GATE", "1") == "1"
+change_gate = ChangeGate(
+    release=float(os.getenv("CHANGE_GATE_RELEASE", "0.5")),
+    max_age=float(os.getenv("CHANGE_GATE_MAX_AGE", "21600")),
+    max_entries=int(os.getenv("CHANGE_GATE_SIZE", "10000")),
+)
+
+# LLM results are reused for identical prompts for LLM_CACHE_TTL_* seconds (0 disables).
+# A fresh result for an endpoint invalidates the device's cached results that build on it.
+llm_cache = ResponseCache(
+    ttls={
+        "events": float(os.getenv("LLM_CACHE_TTL_EVENTS", "900")),
+        "generate-tasks": float(os.getenv("LLM_CACHE_TTL_TASKS", "900")),
+        "updated-tasks": float(os.getenv("LLM_CACHE_TTL_UPDATED_TASKS", "300")),
+        "generate-report": float(os.getenv("LLM_CACHE_TTL_REPORT", "3600")),
+    },
+    max_entries=int(os.getenv("LLM_CACHE_SIZE", "2048")),
+    dependents={
+        "events": ("generate-tasks", "updated-tasks", "generate-report"),
+        "generate-tasks": ("updated-tasks", "generate-report"),
+        "updated-tasks": ("generate-report",),
+    },
+)
+
+# Instrumentation served at /metrics: latency per stage, errors that are handled by degrading
+# (empty retrieval, stale forecast, empty LLM result...) rather than failing the request, LLM token usage
+metrics = Registry()
+stage_seconds = metrics.histogram(
+    "agrisense_stage_seconds", "Latency of each request stage in seconds.", ("stage",),
+)
+handled_errors = metrics.counter(
+    "agrisense_handled_errors_total", "Errors absorbed by a fallback instead of failing the request.", ("path",),
+)
+llm_tokens = metrics.counter(
+    "agrisense_llm_tokens_total", "Tokens reported by the LLM API.", ("endpoint", "kind"),
+)
+decision_paths = metrics.counter(
+    "agrisense_decision_path_total", "Results answered by the rule engine or the LLM.", ("endpoint", "path"),
+)
+
+# Validated shape of each endpoint's LLM output; a completion with nothing usable in it
+# is sent back to the model at most LLM_PARSE_RETRIES times
+OUTPUT_SPECS = {
+    "events": OutputSpec("advisories", AdvisoryOutput),
+    "generate-tasks": OutputSpec("tasks", TaskOutput),
+    "updated-tasks": OutputSpec("updatedTasks", TaskUpdate, aliases=("tasks",)),
+    "generate-report": OutputSpec("weeklySummary", WeeklySummary, aliases=("report",)),
+}
+structured_output = StructuredOutput(
+    retries=int(os.getenv("LLM_PARSE_RETRIES", "1")),
+    observe_parse=lambda seconds: stage_seconds.observe(seconds, stage="parse"),
+)
+
+# Batch endpoints: at most BATCH_MAX_FARMS farms per call, BATCH_LLM_CONCURRENCY LLM calls in flight
+BATCH_MAX_FARMS = int(os.getenv("BATCH_MAX_FARMS", "500"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+# Job mode: JOB_WORKERS jobs run at once, at most JOB_MAX_PENDING wait, finished jobs can be polled
+# for JOB_RESULT_TTL seconds (JOB_DB_PATH keeps them in SQLite across restarts)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "1000"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_WEBHOOK_TIMEOUT = float(os.getenv("JOB_WEBHOOK_TIMEOUT", "10"))
+# callback_url must resolve to a public address, or be on JOB_CALLBACK_HOSTS (comma separated) when set
+JOB_CALLBACK_HOSTS = [host.strip().lower() for host in os.getenv("JOB_CALLBACK_HOSTS", "").split(",") if host.strip()]
+
+# Device state: the server keeps each device's farm profile and last DEVICE_HISTORY readings,
+# DEVICE_STATE_MAX_DEVICES of them in memory (DEVICE_STATE_PATH keeps all of them in SQLite)
+DEVICE_HISTORY = int(os.getenv("DEVICE_HISTORY", "512"))
+DEVICE_STATE_MAX_DEVICES = int(os.getenv("DEVICE_STATE_MAX_DEVICES", "10000"))
+
+# Estimated prompt token budget per endpoint; larger data sections are condensed to fit
+PROMPT_BUDGETS = {
+    "events": int(os.getenv("PROMPT_BUDGET_EVENTS", "3000")),
+    "generate-tasks": int(os.getenv("PROMPT_BUDGET_TASKS", "3500")),
+    "updated-tasks": int(os.getenv("PROMPT_BUDGET_UPDATED_TASKS", "4000")),
+    "generate-report": int(os.getenv("PROMPT_BUDGET_REPORT", "3000")),
+}
+# Farm fields the prompts already list individually
+PROMPT_FARM_FIELDS = ("crop", "currentGrowthStage", "soilType", "fertilizersUsed")
+
+logger = logging.getLogger("agrisense")
 
 # Initialize Groq Client (LLaMA-3)
-groq_client = Groq(api_key=GROQ_API_KEY)  # Replace with your actual API key
+# Retries are left to the LLM gateway, which spaces them out across all callers
+groq_client = AsyncGroq(api_key=GROQ_API_KEY, max_retries=0)  # Replace with your actual API key
+
+def groq_retry_after(error: BaseException) -> Optional[float]:
+    """Seconds Groq asked us to wait when `error` is a rate-limit response, else None."""
+    if not isinstance(error, RateLimitError):
+        return None
+    headers = error.response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        return float(headers.get("retry-after", "1"))
+    except ValueError:
+        return 1.0
+
+# All Groq calls go through one gateway: an adaptive (AIMD) concurrency limit between
+# LLM_CONCURRENCY_MIN and LLM_CONCURRENCY_MAX, an optional LLM_TOKENS_PER_MINUTE budget and
+# shared retry-after pauses. Interactive endpoints are admitted before reports, batches and jobs.
+llm_gateway = LLMGateway(
+    initial_limit=int(os.getenv("LLM_CONCURRENCY", "8")),
+    min_limit=int(os.getenv("LLM_CONCURRENCY_MIN", "1")),
+    max_limit=int(os.getenv("LLM_CONCURRENCY_MAX", "64")),
+    tokens_per_minute=float(os.environ["LLM_TOKENS_PER_MINUTE"]) if os.getenv("LLM_TOKENS_PER_MINUTE") else None,
+    max_retries=int(os.getenv("LLM_RATE_LIMIT_RETRIES", "3")),
+    retry_after=groq_retry_after,
+)
+ENDPOINT_PRIORITY = {"generate-report": REPORT}
+# Raised for work started by batch endpoints and background jobs
+llm_priority: ContextVar[int] = ContextVar("llm_priority", default=INTERACTIVE)
+
+def priority_for(endpoint: str) -> int:
+    return max(llm_priority.get(), ENDPOINT_PRIORITY.get(endpoint, INTERACTIVE))
 
 # Initialize Qdrant Client (Cloud)
-qdrant_client = qdrant_client.QdrantClient(
+qdrant_client = AsyncQdrantClient(
     url=QDRANT_URL,  # Replace with your Qdrant URL
     api_key=QDRANT_API_KEY # Replace with your Qdrant API key
 )
 collection_name = "documents"
 
+# Retrieval filters on the RETRIEVAL_CROP_KEY / RETRIEVAL_SOIL_KEY payload fields (e.g. crop and
+# soil_type) when they are set; leave them empty unless the collection's points carry those fields,
+# since a filter that matches nothing costs a second, unfiltered search. It only fetches
+# RETRIEVAL_PAYLOAD_FIELDS (comma separated, empty fetches the whole payload).
+# RETRIEVAL_HNSW_EF and RETRIEVAL_OVERSAMPLING tune the speed/recall tradeoff.
+# RETRIEVAL_MODE is remote (Qdrant only), local (in-process replica refreshed every
+# LOCAL_INDEX_REFRESH seconds, persisted under LOCAL_INDEX_PATH) or fallback (Qdrant, switching
+# to the replica when Qdrant fails or takes longer than RETRIEVAL_REMOTE_TIMEOUT seconds).
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "remote")
+LOCAL_INDEX_REFRESH = float(os.getenv("LOCAL_INDEX_REFRESH", "3600"))
+advisory_retriever = AdvisoryRetriever(
+    qdrant_client,
+    collection_name,
+    limit=int(os.getenv("RETRIEVAL_LIMIT", "1")),
+    crop_key=os.getenv("RETRIEVAL_CROP_KEY") or None,
+    soil_key=os.getenv("RETRIEVAL_SOIL_KEY") or None,
+    payload_fields=[field for field in os.getenv("RETRIEVAL_PAYLOAD_FIELDS", "").split(",") if field],
+    hnsw_ef=int(os.environ["RETRIEVAL_HNSW_EF"]) if os.getenv("RETRIEVAL_HNSW_EF") else None,
+    quantization_oversampling=float(os.environ["RETRIEVAL_OVERSAMPLING"]) if os.getenv("RETRIEVAL_OVERSAMPLING") else None,
+    mode=RETRIEVAL_MODE,
+    local_index=LocalVectorIndex(os.getenv("LOCAL_INDEX_PATH") or None),
+    remote_timeout=float(os.getenv("RETRIEVAL_REMOTE_TIMEOUT", "2")),
+)
+
+# Shared keep-alive client for the weather API with retries and a circuit breaker
+WEATHER_FETCH_BUDGET = float(os.getenv("WEATHER_FETCH_BUDGET", "8"))
+weather_client = WeatherClient(
+    httpx.AsyncClient(
+        base_url=WEATHER_BASE_URL,
+        timeout=httpx.Timeout(
+            float(os.getenv("WEATHER_READ_TIMEOUT", "5")),
+            connect=float(os.getenv("WEATHER_CONNECT_TIMEOUT", "3")),
+        ),
+        limits=httpx.Limits(
+            max_connections=int(os.getenv("WEATHER_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.getenv("WEATHER_MAX_KEEPALIVE", "10")),
+        ),
+    ),
+    api_key=WEATHER_API_KEY,
+    retries=int(os.getenv("WEATHER_RETRIES", "2")),
+    backoff=float(os.getenv("WEATHER_BACKOFF", "0.5")),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv("WEATHER_BREAKER_THRESHOLD", "5")),
+        reset_timeout=float(os.getenv("WEATHER_BREAKER_RESET", "30")),
+    ),
+)
+
+# Forecasts are shared per lat/lon grid cell (WEATHER_CACHE_GRID degrees) for WEATHER_CACHE_TTL seconds
+forecast_cache = ForecastCache(
+    ttl=float(os.getenv("WEATHER_CACHE_TTL", "1800")),
+    max_entries=int(os.getenv("WEATHER_CACHE_SIZE", "1024")),
+    grid=float(os.getenv("WEATHER_CACHE_GRID", "0.1")),
+    path=os.getenv("WEATHER_CACHE_PATH") or None,
+)
+
+# Embedding model (384-dimension). Loading is deferred so the app can bind before torch is imported:
+# EMBEDDING_PRELOAD=background (default) warms it after startup, eager loads it before serving,
+# lazy waits for the first request that needs it.
+# EMBEDDING_BACKEND picks the runtime: torch (default), torch-int8, onnx or onnx-int8 (ONNX Runtime, no torch
+# import; EMBEDDING_ONNX_FILE overrides the export used). EMBEDDING_THREADS caps the model's intra-op threads.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+embedding_model = EmbeddingModel(
+    "sentence-transformers/all-MiniLM-L6-v2",
+    backend=EMBEDDING_BACKEND,
+    threads=int(os.getenv("EMBEDDING_THREADS", "0")) or None,
+)
+EMBEDDING_PRELOAD = os.getenv("EMBEDDING_PRELOAD", "background")
+EMBEDDING_READY_TIMEOUT = float(os.getenv("EMBEDDING_READY_TIMEOUT", "20"))
+# /updated-tasks settles finished, overdue and near-duplicate tasks (title + description embeddings with
+# cosine similarity >= TASK_DEDUP_THRESHOLD) locally and only sends the rest to the LLM
+TASK_DEDUP_THRESHOLD = float(os.getenv("TASK_DEDUP_THRESHOLD", "0.9"))
+
+# Bounded pool for CPU-bound embedding work so it never runs on the event loop
+embedding_executor = ThreadPoolExecutor(max_workers=EMBEDDING_WORKERS, thread_name_prefix="embed")
+
+# Concurrent requests share encode calls: a batch is flushed at EMBEDDING_BATCH_SIZE texts
+# or after EMBEDDING_BATCH_WAIT_MS milliseconds, whichever comes first
+embedding_batcher = EmbeddingBatcher(
+    embedding_model,
+    embedding_executor,
+    max_batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "32")),
+    max_wait=float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5")) / 1000,
+)
+
+# Query vectors keyed by a hash of the normalized query text (EMBEDDING_CACHE_PATH adds a SQLite tier)
+embedding_cache = EmbeddingCache(
+    max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "4096")),
+    path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+    # torch vectors keep the keys they had before backends were configurable
+    namespace="" if EMBEDDING_BACKEND == "torch" else EMBEDDING_BACKEND,
+)
+
+# With EMBEDDING_QUANTIZE=true summary statistics are rounded to sensor precision (decimal places)
+# before they reach the query text, so jitter below sensor resolution still hits the cache
+EMBEDDING_QUANTIZE = os.getenv("EMBEDDING_QUANTIZE", "false").lower() == "true"
+SENSOR_PRECISION = {
+    "nitrogen": 0,
+    "phosphorus": 0,
+    "potassium": 0,
+    "humidity": 0,
+    "temperature": 1,
+    "conductivity": 2,
+    "pH": 1,
+}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if EMBEDDING_PRELOAD == "eager":
+        await asyncio.to_thread(embedding_model.load)
+    elif EMBEDDING_PRELOAD == "background":
+        embedding_model.start()
+    if os.getenv("RETRIEVAL_CREATE_INDEXES", "false").lower() == "true":
+        try:
+            await advisory_retriever.ensure_indexes()
+        except Exception as e:
+            handled_errors.inc(path="payload_indexes")
+            logger.warning("could not create retrieval payload indexes: %s", e)
+    index_refresher = None
+    if RETRIEVAL_MODE != "remote":
+        await asyncio.to_thread(advisory_retriever.local_index.load)
+        index_refresher = asyncio.create_task(advisory_retriever.refresh_periodically(LOCAL_INDEX_REFRESH))
+    # Under prefork.py every worker shares JOB_DB_PATH; only the first one picks up unfinished jobs
+    await job_queue.start(recover=os.getenv("AGRISENSE_WORKER", "0") == "0")
+    yield
+    await job_queue.stop()
+    if index_refresher is not None:
+        index_refresher.cancel()
+    await webhook_client.aclose()
+    await weather_client.aclose()
+    await qdrant_client.close()
+    await groq_client.close()
+    embedding_executor.shutdown(wait=False)
+
+# Initialize FastAPI
+app = FastAPI(lifespan=lifespan)
+
 # Replace with your Weather API key
 
 class FarmInfo(BaseModel):
@@ -98,86 +405,179 @@ class FarmRequestUpdatedTasks(BaseModel):
     npk_data: List[SensorData]
     advisories: List[Advisories]
 
-# Load the correct embedding model (384-dimension)
-embedding_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")  # 384-D vectors
-
-def truncate_text(text, max_chars=4500):
-    """Truncate text to the specified character limit."""
-    if isinstance(text, str):
-        return text[:max_chars] + "..." if len(text) > max_chars else text
-    return text  # If it's not a string, return as is
+class DeviceUpdate(BaseModel):
+    farm_info: Optional[FarmInfo] = None
+    npk_data: List[SensorData] = []
 
-def search_qdrant_advisories(npk_data: List[dict], crop: str, soil_type: str):
-    try:
-        # Convert NPK data into a structured sentence
-        npk_data_texts = []
-        for npk_entry in npk_data:
-            npk_text = (
-                f"Nitrogen: {npk_entry['nitrogen']}, "
-                f"Phosphorus: {npk_entry['phosphorus']}, "
-                f"Potassium: {npk_entry['potassium']}, "
-                f"Soil Moisture: {npk_entry['humidity']}, "
-                f"Soil Temperature: {npk_entry['temperature']}, "
-                f"Conductivity: {npk_entry['conductivity']}, "
-                f"pH Level: {npk_entry['pH']}"
-            )
-            npk_data_texts.append(npk_text)
+class DeviceUpdateTasks(BaseModel):
+    farm_info: Optional[FarmInfo] = None
+    npk_data: List[SensorData] = []
+    advisories: List[Advisories]
 
-        # Join all NPK entries into a single text
-        npk_combined_text = " | ".join(npk_data_texts)
+class DeviceUpdateUpdatedTasks(BaseModel):
+    tasks: List[Tasks]
+    farm_info: Optional[FarmInfo] = None
+    npk_data: List[SensorData] = []
+    advisories: List[Advisories]
 
-        # Formulate search query as a natural text prompt
-        search_text = (
-            f"Crop Type: {crop}. Soil Type: {soil_type}. "
-            f"Soil Nutrient Levels: {npk_combined_text}."
-        )
+class FarmBatchRequest(BaseModel):
+    farms: List[FarmRequest]
+
+class FarmBatchRequestTasks(BaseModel):
+    farms: List[FarmRequestTasks]
+
+async def encode_text(text: str) -> list:
+    """Encode text through the embedding cache and shared micro-batcher and return a plain list vector."""
+    with stage_seconds.time(stage="encode"):
+        vector = await embedding_cache.get(text)
+        if vector is None:
+            vector = await embedding_batcher.encode(text)
+            await embedding_cache.put(text, vector)
+    return vector.tolist()
+
+async def encode_texts(texts: List[str]) -> List[list]:
+    """Encode many texts with a single encode call, skipping cached and duplicate texts."""
+    with stage_seconds.time(stage="encode"):
+        vectors = {text: await embedding_cache.get(text) for text in dict.fromkeys(texts)}
+        missing = [text for text, vector in vectors.items() if vector is None]
+        if missing:
+            loop = asyncio.get_running_loop()
+            encoded = await loop.run_in_executor(embedding_executor, embedding_model.encode, missing)
+            for text, vector in zip(missing, encoded):
+                vectors[text] = vector
+                await embedding_cache.put(text, vector)
+    return [vectors[text].tolist() for text in texts]
+
+def retrieval_query(npk_data: List[dict], crop: str, soil_type: str) -> str:
+    # Summarize the sensor history into fixed-size per-metric statistics so the query
+    # stays within the model's token limit however many readings the device sends
+    npk_summary_text = describe(
+        summarize(npk_data),
+        SENSOR_PRECISION if EMBEDDING_QUANTIZE else None,
+    )
+
+    # Formulate search query as a natural text prompt
+    return (
+        f"Crop Type: {crop}. Soil Type: {soil_type}. "
+        f"Soil Nutrient Levels: {npk_summary_text}."
+    )
+
+async def search_qdrant_advisories(npk_data: List[dict], crop: str, soil_type: str):
+    try:
+        search_text = retrieval_query(npk_data, crop, soil_type)
 
         # Generate the correct 384-D embedding
-        query_vector = embedding_model.encode(search_text).tolist()
-
-        # Perform the Qdrant vector search
-        search_results = qdrant_client.search(
-            collection_name=collection_name,
-            query_vector=query_vector,  # ✅ Correct 384-D vector
-            limit=1,
-        )
-
-        json_results = [
-            {
-                "id": result.id,
-                "score": result.score,
-                "payload": {
-                    key: truncate_text(value) if isinstance(value, str) else value  # Apply truncation only on text values
-                    for key, value in result.payload.items()
-                }
-            }
-            for result in search_results
-        ]
+        query_vector = await encode_text(search_text)
 
-        return json_results
+        # Perform the Qdrant vector search, narrowed to the farm's crop and soil type
+        with stage_seconds.time(stage="vector_search"):
+            return await advisory_retriever.search(query_vector, crop, soil_type)
 
     except Exception as e:
+        handled_errors.inc(path="retrieval")
+        logger.warning("advisory retrieval failed: %s", e)
         return []
 
-def fetch_weather_forecast(latitude: float, longitude: float):
+async def search_qdrant_advisories_batch(farms: List[dict]) -> List[list]:
+    """Retrieve context for many farms with one encode call and one Qdrant batch search."""
     try:
-        url = f"https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/timeline/{latitude},{longitude}/next3days?key={WEATHER_API_KEY}&contentType=json&include=days"
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        weather_data = response.json().get("days", [])
+        search_texts = [
+            retrieval_query(farm["npk_data"], farm["farm_info"]["crop"], farm["farm_info"]["soilType"])
+            for farm in farms
+        ]
+        query_vectors = await encode_texts(search_texts)
+        with stage_seconds.time(stage="vector_search"):
+            return await advisory_retriever.search_many(
+                query_vectors,
+                [farm["farm_info"]["crop"] for farm in farms],
+                [farm["farm_info"]["soilType"] for farm in farms],
+            )
 
-        return weather_data
-    except requests.RequestException as e:
+    except Exception as e:
+        handled_errors.inc(path="retrieval_batch")
+        logger.warning("batch advisory retrieval failed: %s", e)
+        return [[] for _ in farms]
+
+async def fetch_weather_forecast(latitude: float, longitude: float):
+    """Return the forecast for the farm's grid cell, served from the cache when fresh."""
+    latitude, longitude = float(latitude), float(longitude)
+    with stage_seconds.time(stage="weather"):
+        try:
+            return await asyncio.wait_for(
+                forecast_cache.get_or_fetch(latitude, longitude, weather_client.fetch),
+                timeout=WEATHER_FETCH_BUDGET,
+            )
+        except (WeatherUnavailable, asyncio.TimeoutError):
+            # Serve the last known forecast for the cell while the upstream is failing
+            handled_errors.inc(path="weather")
+            return await forecast_cache.lookup(forecast_cache.cell(latitude, longitude), allow_stale=True)
+
+def assemble_prompt(endpoint: str, render, sections: dict) -> Prompt:
+    """Build an endpoint's prompt within its token budget and report its size."""
+    with stage_seconds.time(stage="prompt_build"):
+        prompt = build_prompt(endpoint, render, sections, PROMPT_BUDGETS[endpoint])
+    logger.info(
+        "prompt %s: ~%d tokens (budget %d) sections %s",
+        endpoint, prompt.tokens, prompt.budget, prompt.sections,
+    )
+    return prompt
+
+def record_usage(endpoint: str, response) -> Optional[int]:
+    """Count the tokens a response reports and return their total (None when it reports none)."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
         return None
-
-def generate_advisories(farm_request: dict, weather_forecast: list, qdrant_advisories: list):
-    """
-    Generate structured advisories using LLM with Qdrant search results as additional context.
-    """
-    qdrant_context = json.dumps(qdrant_advisories) if qdrant_advisories else "No similar past advisories found."
-    
-    prompt = f"""
+    llm_tokens.inc(usage.prompt_tokens or 0, endpoint=endpoint, kind="prompt")
+    llm_tokens.inc(usage.completion_tokens or 0, endpoint=endpoint, kind="completion")
+    return (usage.prompt_tokens or 0) + (usage.completion_tokens or 0)
+
+async def generate_structured(endpoint: str, prompt: Prompt, device_id: str) -> dict:
+    """Run `prompt` through the LLM (or the result cache) and return `{key: [validated items]}`."""
+    spec = OUTPUT_SPECS[endpoint]
+
+    priority = priority_for(endpoint)
+
+    async def complete(messages: List[dict]) -> Optional[str]:
+        async def request(reservation):
+            with stage_seconds.time(stage="llm"):
+                response = await groq_client.chat.completions.create(
+                    model=LLM_MODEL,
+                    messages=messages,
+                    temperature=0.7,
+                    max_tokens=LLM_MAX_TOKENS,
+                    response_format={"type": "json_object"}
+                )
+            reservation.used(record_usage(endpoint, response))
+            return response
+
+        tokens = sum(estimate_tokens(message["content"]) for message in messages) + LLM_MAX_TOKENS
+        response = await llm_gateway.call(priority, tokens, request)
+        if not response.choices:
+            return None
+        return response.choices[0].message.content
+
+    async def call_llm():
+        try:
+            items = await structured_output.generate(endpoint, spec, prompt.text, complete)
+        except RateLimited as e:
+            # An empty result here would look like "nothing to do"; tell the client to come back
+            handled_errors.inc(path="llm_rate_limited")
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
+        except Exception as e:
+            handled_errors.inc(path="llm")
+            logger.warning("%s LLM call failed: %s", endpoint, e)
+            items = []
+        return {spec.key: items}
+
+    return await llm_cache.get_or_compute(
+        endpoint, LLM_MODEL, prompt.text, device_id, call_llm,
+        cacheable=lambda result: bool(result[spec.key]),
+    )
+
+def advisories_prompt(farm_request: dict, weather_forecast: list, qdrant_advisories: list) -> Prompt:
+    """Build the advisory prompt from farm data, forecast and retrieved context."""
+    def render(data):
+        return f"""
 ### 🌱 **Agricultural Advisory Generation** 🌱  
 You are an **elite precision farming expert** specializing in **crop-specific, growth-stage-aware, and data-driven advisories.**  
 
@@ -188,13 +588,13 @@ Using the provided **farm data, soil conditions, weather forecast, past advisori
 
 ### 📌 **Farm & Environmental Data (Strictly Consider All Factors)**
 - **Crop Type:** {farm_request['farm_info']['crop']}  
-- Farm info {farm_request['farm_info']}
+- Farm info {data['farm']}
 - **Current Growth Stage:** {farm_request['farm_info']['currentGrowthStage']}  
 - **Soil Type:** {farm_request['farm_info']['soilType']}  
 - **Fertilizers Applied:** {farm_request['farm_info']['fertilizersUsed']}  
-- **Weather Forecast (Next 7 Days):** {json.dumps(weather_forecast, indent=2)}  
-- **Soil Nutrient Profile (NPK, pH, Conductivity, Moisture, etc.):** {json.dumps(farm_request['npk_data'], indent=2)}  
-- **Past Relevant Advisories from Vector DB:** {qdrant_context}  
+- **Weather Forecast (Next 7 Days):** {data['weather']}  
+- **Soil Nutrient Profile (NPK, pH, Conductivity, Moisture, etc.):** {data['sensors']}  
+- **Past Relevant Advisories from Vector DB:** {data['retrieval']}  
 
 Units of NKP are in mg/L, temperature in °C, and humidity in %.
 ---
@@ -237,37 +637,41 @@ Generate most critical advisories, merging related points where necessary.
 generate max 3 advisories daily and no other text other than these tasks , return only json data nothing else  return only json data nothing else not a single line
 """
 
+    return assemble_prompt("events", render, {
+        "farm": [farm_profile(farm_request['farm_info'], exclude=PROMPT_FARM_FIELDS)],
+        "weather": weather_renderings(weather_forecast),
+        "sensors": sensor_renderings(farm_request['npk_data']),
+        "retrieval": retrieval_renderings(qdrant_advisories),
+    })
+
+def fast_path(endpoint: str, farm_request: dict, weather_forecast: list, template) -> Optional[List[dict]]:
+    """Template items when the rule engine finds nothing abnormal, None when the LLM has to decide."""
+    if not RULES_FAST_PATH:
+        decision_paths.inc(endpoint=endpoint, path="llm")
+        return None
+    with stage_seconds.time(stage="rules"):
+        verdict = rule_engine.evaluate(farm_request['farm_info'], farm_request['npk_data'], weather_forecast)
+    decision_paths.inc(endpoint=endpoint, path=verdict.path)
+    if verdict.path != "rules":
+        logger.debug("%s needs the LLM: %s", endpoint, "; ".join(verdict.reasons))
+        return None
+    return template(farm_request['farm_info'], farm_request['npk_data'], weather_forecast)
 
-
-    try:
-        response = groq_client.chat.completions.create(
-            model="meta-llama/llama-4-scout-17b-16e-instruct",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=1024,
-            response_format={"type":"json_object"}
-        )
-
-        if not response.choices or not response.choices[0].message.content:
-            return {"advisories": []}
-
-        llm_output = response.choices[0].message.content.strip()
-        try:
-            return {"advisories": llm_output}
-        except json.JSONDecodeError:
-            return {"advisories": []}
-
-    except Exception as e:
-        return {"advisories": []}
-
-def generate_tasks_func(farm_request: dict, weather_forecast: list, qdrant_advisories: list):
+async def generate_advisories(farm_request: dict, weather_forecast: list, qdrant_advisories: list):
     """
     Generate structured advisories using LLM with Qdrant search results as additional context.
     """
-    qdrant_context = json.dumps(qdrant_advisories) if qdrant_advisories else "No similar past advisories found."
-    
+    items = fast_path("events", farm_request, weather_forecast, template_advisories)
+    if items is not None:
+        return {"advisories": items, "path": "rules"}
+    prompt = advisories_prompt(farm_request, weather_forecast, qdrant_advisories)
+    return {**await generate_structured("events", prompt, farm_request['farm_info']['deviceId']), "path": "llm"}
+
+def tasks_prompt(farm_request: dict, weather_forecast: list, qdrant_advisories: list) -> Prompt:
+    """Build the task generation prompt from farm data, forecast, advisories and retrieved context."""
     # Using triple quotes and escaping curly braces properly in the JSON example
-    prompt = f"""
+    def render(data):
+        return f"""
     ### 🚜 **Precision Agriculture Task Generator** 🌱  
 You are an **elite agricultural task management AI**, specializing in **data-driven, urgency-aware, and precision-farming-focused task generation**.  
 
@@ -280,13 +684,13 @@ Using **real-time farm data, environmental conditions, advisories, and past task
 - **Crop Type:** {farm_request['farm_info']['crop']}  
 - **Current Growth Stage:** {farm_request['farm_info']['currentGrowthStage']}  
 - **Soil Type:** {farm_request['farm_info']['soilType']}  
- Farm info {farm_request['farm_info']}
+ Farm info {data['farm']}
 - **Fertilizers Applied:** {farm_request['farm_info']['fertilizersUsed']}  
-- **Weather Forecast (Next 7 Days):** {json.dumps(weather_forecast, indent=2)}  
-- **Soil Nutrient Profile (NPK, pH, Conductivity, Moisture, etc.):** {json.dumps(farm_request['npk_data'], indent=2)}  
+- **Weather Forecast (Next 7 Days):** {data['weather']}  
+- **Soil Nutrient Profile (NPK, pH, Conductivity, Moisture, etc.):** {data['sensors']}  
 - **Irrigation System:** {farm_request['farm_info']['irrigationType']}  
-- **Recent Advisories (Last 48 Hours):** {json.dumps(farm_request['advisories'], indent=2)}  
-Past Relevant Advisories from Vector DB:** {qdrant_context}  
+- **Recent Advisories (Last 48 Hours):** {data['advisories']}  
+Past Relevant Advisories from Vector DB:** {data['retrieval']}  
 📌 *Units: NPK in mg/L, temperature in °C, humidity in %.*
 
 ---
@@ -346,46 +750,29 @@ Your output must be properly formatted JSON object with a "tasks" array containi
 
 Generate max 2 tasks daily and return ONLY valid JSON data in exactly the format shown above, with a "tasks" array containing the task objects.
 """
-    
-    try:
-        response = groq_client.chat.completions.create(
-            model="meta-llama/llama-4-scout-17b-16e-instruct",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=1024,
-            response_format={"type": "json_object"}
-        )
-        
-        if not response.choices or not response.choices[0].message.content:
-            return {"tasks": []}
-        
-        llm_output = response.choices[0].message.content.strip()
-        
-        try:
-            # Parse the JSON output
-            parsed_output = json.loads(llm_output)
-            
-            # Ensure the output has the expected structure
-            if "tasks" not in parsed_output:
-                if isinstance(parsed_output, list):
-                    return {"tasks": parsed_output}
-                else:
-                    return {"tasks": [parsed_output]}
-            return parsed_output
-            
-        except json.JSONDecodeError as json_error:
-            return {"tasks": []}
 
-    except Exception as e:
-        return {"tasks": []}
+    return assemble_prompt("generate-tasks", render, {
+        "farm": [farm_profile(farm_request['farm_info'], exclude=PROMPT_FARM_FIELDS + ("irrigationType",))],
+        "weather": weather_renderings(weather_forecast),
+        "sensors": sensor_renderings(farm_request['npk_data']),
+        "advisories": records_renderings(farm_request['advisories']),
+        "retrieval": retrieval_renderings(qdrant_advisories),
+    })
 
-def update_tasks(farm_request: dict, weather_forecast: list):
+async def generate_tasks_func(farm_request: dict, weather_forecast: list, qdrant_advisories: list):
     """
     Generate structured advisories using LLM with Qdrant search results as additional context.
     """
-    import json
-    
-    prompt = f"""
+    items = fast_path("generate-tasks", farm_request, weather_forecast, template_tasks)
+    if items is not None:
+        return {"tasks": items, "path": "rules"}
+    prompt = tasks_prompt(farm_request, weather_forecast, qdrant_advisories)
+    return {**await generate_structured("generate-tasks", prompt, farm_request['farm_info']['deviceId']), "path": "llm"}
+
+def updated_tasks_prompt(farm_request: dict, weather_forecast: list) -> Prompt:
+    """Build the pending-task review prompt."""
+    def render(data):
+        return f"""
 ### 🚜 **Precision Agriculture Task Updater** 🌱  
 You are an **elite agricultural automation AI**, specializing in **real-time task optimization** for **smart farming devices**. Your role is to analyze active agricultural tasks and ensure they remain relevant, efficient, and aligned with real-time farm conditions. The goal is to eliminate redundant or outdated tasks while making precise updates to those that need modification.  
 
@@ -412,12 +799,12 @@ These data sources will guide your decision-making:
 - **Fertilizers Applied:** {farm_request['farm_info']['fertilizersUsed']}  
 
 ### 🌦 **Environmental Conditions**  
-- **Weather Forecast (Next 7 Days):** {json.dumps(weather_forecast, indent=2)}  
-- **Farm Sensor Data (NPK, pH, Moisture, Temperature, etc.):** {json.dumps(farm_request['npk_data'], indent=2)}  
-- **Active Farm Advisories & Climate Alerts:** {json.dumps(farm_request['advisories'], indent=2)}  
+- **Weather Forecast (Next 7 Days):** {data['weather']}  
+- **Farm Sensor Data (NPK, pH, Moisture, Temperature, etc.):** {data['sensors']}  
+- **Active Farm Advisories & Climate Alerts:** {data['advisories']}  
 
 ### 📋 **Pending Farm Tasks**  
-- **Unfinished Tasks:** {json.dumps(farm_request['tasks'], indent=2)}  
+- **Unfinished Tasks:** {data['tasks']}  
 
 📌 *Units: NPK in mg/L, temperature in °C, moisture in %.*  
 
@@ -481,82 +868,30 @@ The output must be a proper JSON object with the "updatedTasks" key containing a
 All task updates must be inside this array, not separate objects.
 Output only this JSON object, nothing else.
 """
-    try:
-        response = groq_client.chat.completions.create(
-            model="meta-llama/llama-4-scout-17b-16e-instruct",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=1024,
-            response_format={"type": "json_object"}
-        )
-
-        if not response.choices or not response.choices[0].message.content:
-            return {"updatedTasks": []}
-
-        llm_output = response.choices[0].message.content.strip()
-        
-        try:
-            # Parse the output as JSON
-            parsed_output = json.loads(llm_output)
-            
-            # Check if the expected structure exists
-            if isinstance(parsed_output, dict) and "updatedTasks" in parsed_output:
-                return parsed_output
-            else:
-                # If there's no "updatedTasks" key but we have some valid JSON,
-                # try to wrap it in the correct structure
-                if isinstance(parsed_output, list):
-                    return {"updatedTasks": parsed_output}
-                else:
-                    # If we can't determine how to handle it, return empty array
-                    return {"updatedTasks": []}
-                
-        except json.JSONDecodeError as e:
-            
-            # Fallback: Try to clean and fix the output by wrapping it in the correct structure
-            try:
-                # Simple fix attempt: check if there are multiple JSON objects
-                if llm_output.strip().startswith("{") and "}" in llm_output:
-                    # Try to split multiple JSON objects and wrap them in an array
-                    objects = []
-                    # Basic string manipulation to find individual JSON objects
-                    current_obj = ""
-                    brace_count = 0
-                    for char in llm_output:
-                        if char == "{":
-                            brace_count += 1
-                        elif char == "}":
-                            brace_count -= 1
-                        
-                        current_obj += char
-                        
-                        # When we have a complete object
-                        if brace_count == 0 and current_obj.strip():
-                            try:
-                                parsed_obj = json.loads(current_obj)
-                                objects.append(parsed_obj)
-                                current_obj = ""
-                            except:
-                                # If it's not a valid JSON object, continue collecting
-                                pass
-                    
-                    if objects:
-                        return {"updatedTasks": objects}
-                
-                # If nothing else works, return empty array
-                return {"updatedTasks": []}
-                
-            except Exception:
-                return {"updatedTasks": []}
 
-    except Exception as e:
-        return {"updatedTasks": []}
+    return assemble_prompt("updated-tasks", render, {
+        "weather": weather_renderings(weather_forecast),
+        "sensors": sensor_renderings(farm_request['npk_data']),
+        "advisories": records_renderings(farm_request['advisories']),
+        "tasks": [compact_json([{key: value for key, value in task.items() if key != "deviceId"} for task in farm_request['tasks']])],
+    })
 
-def summary_report(farm_request: dict, weather_forecast: list):
+async def update_tasks(farm_request: dict, weather_forecast: list, triage: Optional[Triage] = None):
     """
     Generate structured advisories using LLM with Qdrant search results as additional context.
     """
-    prompt = f"""
+    if triage is None:
+        triage = Triage(candidates=farm_request['tasks'])
+    if not triage.candidates:
+        return {"updatedTasks": triage.updates}
+    prompt = updated_tasks_prompt({**farm_request, "tasks": triage.candidates}, weather_forecast)
+    result = await generate_structured("updated-tasks", prompt, farm_request['farm_info']['deviceId'])
+    return {"updatedTasks": triage.updates + result["updatedTasks"]}
+
+def report_prompt(farm_request: dict, weather_forecast: list) -> Prompt:
+    """Build the weekly report prompt."""
+    def render(data):
+        return f"""
 ### 📊 **Weekly Farm Health, Yield Forecast & Sustainability Report** 🌱  
 
 You are an **AI agronomist and precision farming specialist**, tasked with analyzing the farm’s **weekly performance** and providing an **expert-level strategic report**. Your goal is to assess **soil health, environmental conditions, emerging risks, and yield projections** to ensure optimal farm productivity and sustainability.  
@@ -574,8 +909,8 @@ Using the provided farm advisories, environmental data, and operational insights
 
 ## 📌 **Input Data for Analysis**  
 You will receive:  
-- **Farm Advisories & Environmental Trends:** {json.dumps(farm_request['advisories'], indent=2)}  
-- **Soil & Crop Health Data (NPK, Moisture, pH, EC, Temperature):** {json.dumps(farm_request['npk_data'], indent=2)}  
+- **Farm Advisories & Environmental Trends:** {data['advisories']}  
+- **Soil & Crop Health Data (NPK, Moisture, pH, EC, Temperature):** {data['sensors']}  
 - **Weather Conditions & Seasonal Patterns:** (if applicable)  
 
 📌 *Units: NPK in mg/L, pH in standard units, EC in dS/m, temperature in °C, soil moisture in %.*  
@@ -627,117 +962,517 @@ Return a structured **JSON response** in the following format:
  return only json data nothing else not a single line
 """
 
-    try:
-        response = groq_client.chat.completions.create(
-            model="meta-llama/llama-4-scout-17b-16e-instruct",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=1024,
-            response_format={"type":"json_object"}
-        )
+    return assemble_prompt("generate-report", render, {
+        "advisories": records_renderings(farm_request['advisories']),
+        "sensors": sensor_renderings(farm_request['npk_data']),
+    })
 
-        if not response.choices or not response.choices[0].message.content:
-            return {"weeklySummary": []}
+async def summary_report(farm_request: dict, weather_forecast: list):
+    """
+    Generate structured advisories using LLM with Qdrant search results as additional context.
+    """
+    prompt = report_prompt(farm_request, weather_forecast)
+    return await generate_structured("generate-report", prompt, farm_request['farm_info']['deviceId'])
 
-        llm_output = response.choices[0].message.content.strip()
+def weather_stage(farm_data: dict) -> Stage:
+    latitude, longitude = farm_data["farm_info"]["latitude"], farm_data["farm_info"]["longitude"]
 
-        try:
-            return {"weeklySummary": llm_output}
-        except json.JSONDecodeError:
-            return {"weeklySummary": []}
+    async def run(results):
+        weather_forecast = await fetch_weather_forecast(latitude, longitude)
+        if not weather_forecast:
+            raise HTTPException(status_code=503, detail="Weather API fetch failed.")
+        return weather_forecast
 
-    except Exception as e:
-        return {"weeklySummary": []}
+    return Stage("weather", run, timeout=WEATHER_STAGE_TIMEOUT, required=True)
 
-@app.post("/events")
-async def generate_farm_advisory(request: FarmRequest):
+async def wait_for_embedding_model(results):
     try:
-        farm_data = request.dict()
-        latitude, longitude = farm_data["farm_info"]["latitude"], farm_data["farm_info"]["longitude"]
+        await embedding_model.wait(timeout=EMBEDDING_READY_TIMEOUT)
+    except ModelNotReady as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
 
-        # Fetch weather forecast
-        weather_forecast = fetch_weather_forecast(latitude, longitude)
-        if not weather_forecast:
-            raise HTTPException(status_code=500, detail="Weather API fetch failed.")
+def model_stage() -> Stage:
+    return Stage("model", wait_for_embedding_model, required=True)
 
-        # Fetch past relevant advisories from Qdrant
-        qdrant_advisories = search_qdrant_advisories(
+def retrieval_stage(farm_data: dict) -> Stage:
+    async def run(results):
+        return await search_qdrant_advisories(
             npk_data=farm_data["npk_data"],
             crop=farm_data["farm_info"]["crop"],
             soil_type=farm_data["farm_info"]["soilType"]
         )
 
-        # Generate advisories using LLM with Qdrant context
-        advisories = generate_advisories(farm_data, weather_forecast, qdrant_advisories)
+    return Stage("retrieval", run, deps=("model",), timeout=RETRIEVAL_STAGE_TIMEOUT, default=[])
+
+async def run_pipeline(stages: List[Stage], response: Response):
+    """Run the stage graph, expose per-stage timings and return the last stage's result."""
+    run = await run_stages(stages)
+    for name, timing in run.timings.items():
+        if timing.status != "ok":
+            # Optional stage that failed or timed out and was replaced by its default
+            handled_errors.inc(path=f"stage_{name}_{timing.status}")
+    response.headers["Server-Timing"] = run.server_timing()
+    logger.debug("stage timings %s, critical path %s", run.server_timing(), " -> ".join(run.critical_path()))
+    return run.results[stages[-1].name]
+
+def gated(endpoint: str, farm_data: dict, refresh: bool, compute) -> Callable[[dict], Awaitable[dict]]:
+    """Stage function that reuses the device's previous result unless its farm state changed significantly."""
+    async def run(results):
+        if not CHANGE_GATE:
+            return await compute(results)
+        return await change_gate.get_or_compute(
+            endpoint,
+            farm_data["farm_info"]["deviceId"],
+            farm_data,
+            results["weather"],
+            lambda: compute(results),
+            force=refresh,
+            cacheable=lambda result: bool(result[OUTPUT_SPECS[endpoint].key]),
+        )
 
-        return advisories
+    return run
+
+def advisory_stages(farm_data: dict, refresh: bool = False) -> List[Stage]:
+    # Weather and Qdrant retrieval are independent, so they run concurrently
+    return [
+        weather_stage(farm_data),
+        model_stage(),
+        retrieval_stage(farm_data),
+        Stage(
+            "llm",
+            gated(
+                "events", farm_data, refresh,
+                lambda results: generate_advisories(farm_data, results["weather"], results["retrieval"]),
+            ),
+            deps=("weather", "retrieval"),
+            timeout=LLM_STAGE_TIMEOUT,
+            required=True,
+        ),
+    ]
+
+def tasks_stages(farm_data: dict, refresh: bool = False) -> List[Stage]:
+    return [
+        weather_stage(farm_data),
+        model_stage(),
+        retrieval_stage(farm_data),
+        Stage(
+            "llm",
+            gated(
+                "generate-tasks", farm_data, refresh,
+                lambda results: generate_tasks_func(farm_data, results["weather"], results["retrieval"]),
+            ),
+            deps=("weather", "retrieval"),
+            timeout=LLM_STAGE_TIMEOUT,
+            required=True,
+        ),
+    ]
 
+@app.post("/events")
+async def generate_farm_advisory(request: FarmRequest, response: Response, refresh: bool = Query(False)):
+    try:
+        farm_data = request.dict()
+
+        return await run_pipeline(advisory_stages(farm_data, refresh), response)
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/generate-tasks")
-async def generate_tasks(request: FarmRequestTasks):
+async def generate_tasks(request: FarmRequestTasks, response: Response, refresh: bool = Query(False)):
     try:
         farm_data = request.dict()
-        latitude, longitude = farm_data["farm_info"]["latitude"], farm_data["farm_info"]["longitude"]
 
-        # Fetch weather forecast
-        weather_forecast = fetch_weather_forecast(latitude, longitude)
-        if not weather_forecast:
-            raise HTTPException(status_code=500, detail="Weather API fetch failed.")
+        return await run_pipeline(tasks_stages(farm_data, refresh), response)
 
-        # Fetch past relevant advisories from Qdrant
-        qdrant_advisories = search_qdrant_advisories(
-            npk_data=farm_data["npk_data"],
-            crop=farm_data["farm_info"]["crop"],
-            soil_type=farm_data["farm_info"]["soilType"]
-        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Generate advisories using LLM with Qdrant context
-        advisories = generate_tasks_func(farm_data, weather_forecast, qdrant_advisories)
+def triage_stage(farm_data: dict) -> Stage:
+    # Final and overdue tasks are settled without the model, so that much always happens
+    triage = triage_tasks(farm_data["tasks"])
+
+    async def run(results):
+        if len(triage.candidates) < 2:
+            return triage
+        if not embedding_model.ready:
+            # Duplicates are left to the LLM rather than waiting for the model to load
+            handled_errors.inc(path="task_dedup")
+            return triage
+        vectors = await encode_texts([task_text(task) for task in triage.candidates])
+        return merge_duplicates(triage, np.asarray(vectors), TASK_DEDUP_THRESHOLD)
+
+    # On a timeout or an encoding failure the duplicates are left to the LLM, the rest still applies
+    return Stage("triage", run, timeout=RETRIEVAL_STAGE_TIMEOUT, default=triage)
+
+def updated_tasks_stages(farm_data: dict, refresh: bool = False) -> List[Stage]:
+    return [
+        weather_stage(farm_data),
+        triage_stage(farm_data),
+        Stage(
+            "llm",
+            gated(
+                "updated-tasks", farm_data, refresh,
+                lambda results: update_tasks(farm_data, results["weather"], results["triage"]),
+            ),
+            deps=("weather", "triage"),
+            timeout=LLM_STAGE_TIMEOUT,
+            required=True,
+        ),
+    ]
+
+def report_stages(farm_data: dict, refresh: bool = False) -> List[Stage]:
+    return [
+        weather_stage(farm_data),
+        Stage(
+            "llm",
+            gated(
+                "generate-report", farm_data, refresh,
+                lambda results: summary_report(farm_data, results["weather"]),
+            ),
+            deps=("weather",),
+            timeout=LLM_STAGE_TIMEOUT,
+            required=True,
+        ),
+    ]
 
-        return advisories
+@app.post("/updated-tasks")
+async def generate_updated_tasks(request: FarmRequestUpdatedTasks, response: Response, refresh: bool = Query(False)):
+    try:
+        farm_data = request.dict()
 
+        return await run_pipeline(updated_tasks_stages(farm_data, refresh), response)
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/updated-tasks")
-async def generate_updated_tasks(request: FarmRequestUpdatedTasks):
+@app.post("/generate-report")
+async def generate_report(request: FarmRequestUpdatedTasks, response: Response, refresh: bool = Query(False)):
     try:
         farm_data = request.dict()
-        latitude, longitude = farm_data["farm_info"]["latitude"], farm_data["farm_info"]["longitude"]
 
-        # Fetch weather forecast
-        weather_forecast = fetch_weather_forecast(latitude, longitude)
-        if not weather_forecast:
-            raise HTTPException(status_code=500, detail="Weather API fetch failed.")
+        return await run_pipeline(report_stages(farm_data, refresh), response)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-       
 
-        # Generate advisories using LLM with Qdrant context
-        advisories = update_tasks(farm_data, weather_forecast)
+async def fetch_weather_batch(farms: List[dict]) -> dict:
+    """Fetch one forecast per distinct grid cell and return them keyed by cell."""
+    cells = {}
+    for farm in farms:
+        latitude, longitude = float(farm["farm_info"]["latitude"]), float(farm["farm_info"]["longitude"])
+        cells.setdefault(forecast_cache.cell(latitude, longitude), (latitude, longitude))
+    forecasts = await asyncio.gather(
+        *(fetch_weather_forecast(latitude, longitude) for latitude, longitude in cells.values())
+    )
+    return dict(zip(cells, forecasts))
 
-        return advisories
+async def run_batch(farms: List[dict], generate) -> AsyncIterator[str]:
+    """
+    Process many farms with shared weather and retrieval work, fanning the LLM calls out
+    under BATCH_LLM_CONCURRENCY. Results are streamed as NDJSON lines in completion order.
+    """
+    try:
+        await embedding_model.wait(timeout=EMBEDDING_READY_TIMEOUT)
+        forecasts, retrievals = await asyncio.gather(
+            fetch_weather_batch(farms),
+            search_qdrant_advisories_batch(farms),
+        )
+    except Exception as e:
+        handled_errors.inc(path="batch_setup")
+        yield json.dumps({"error": str(e)}) + "\n"
+        return
+
+    semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+    # Copied into the per-farm tasks below, so their LLM calls queue behind interactive requests
+    llm_priority.set(BACKGROUND)
+
+    async def process(index: int, farm: dict):
+        farm_info = farm["farm_info"]
+        line = {"index": index, "deviceId": farm_info["deviceId"]}
+        forecast = forecasts[forecast_cache.cell(float(farm_info["latitude"]), float(farm_info["longitude"]))]
+        if not forecast:
+            handled_errors.inc(path="batch_item")
+            return {**line, "error": "Weather API fetch failed."}
+        try:
+            async with semaphore:
+                return {**line, "result": await generate(farm, forecast, retrievals[index])}
+        except Exception as e:
+            handled_errors.inc(path="batch_item")
+            return {**line, "error": str(e)}
+
+    for completed in asyncio.as_completed([process(index, farm) for index, farm in enumerate(farms)]):
+        yield json.dumps(jsonable_encoder(await completed), ensure_ascii=False) + "\n"
+
+def batch_response(farms: List[dict], generate) -> StreamingResponse:
+    if len(farms) > BATCH_MAX_FARMS:
+        raise HTTPException(status_code=413, detail=f"A batch may contain at most {BATCH_MAX_FARMS} farms.")
+    return StreamingResponse(run_batch(farms, generate), media_type="application/x-ndjson")
+
+@app.post("/events/batch")
+async def generate_farm_advisory_batch(request: FarmBatchRequest):
+    """Advisories for many farms in one call, streamed back one NDJSON line per farm."""
+    return batch_response([farm.dict() for farm in request.farms], generate_advisories)
+
+@app.post("/generate-tasks/batch")
+async def generate_tasks_batch(request: FarmBatchRequestTasks):
+    """Tasks for many farms in one call, streamed back one NDJSON line per farm."""
+    return batch_response([farm.dict() for farm in request.farms], generate_tasks_func)
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_llm(prompt: Prompt, fields: Sequence[Optional[str]], event: Optional[str]) -> AsyncIterator[str]:
+    """
+    Stream a Groq completion as server-sent events, emitting each array element of the
+    JSON output as soon as it is complete. `event` names the events; when it is None the
+    key of the array the element belongs to is used instead.
+    """
+    parser = JsonStreamParser(fields)
+    count = 0
+    try:
+        # The slot is held for the whole stream; a rate-limited stream is reported, not retried
+        reservation = await llm_gateway.reserve(priority_for(prompt.endpoint), prompt.tokens + LLM_MAX_TOKENS)
+        async with reservation:
+            with stage_seconds.time(stage="llm_stream"):
+                # JSON mode is not available for streamed completions; the prompts already demand bare JSON
+                stream = await groq_client.chat.completions.create(
+                    model=LLM_MODEL,
+                    messages=[{"role": "user", "content": prompt.text}],
+                    temperature=0.7,
+                    max_tokens=LLM_MAX_TOKENS,
+                    stream=True,
+                )
+                async for chunk in stream:
+                    # Groq reports usage on the final chunk
+                    used = record_usage(prompt.endpoint, getattr(chunk, "x_groq", None))
+                    if used is not None:
+                        reservation.used(used)
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    for field, value in parser.feed(chunk.choices[0].delta.content):
+                        count += 1
+                        yield sse_event(event or field, value)
+    except Exception as e:
+        handled_errors.inc(path="stream")
+        yield sse_event("error", {"detail": str(e)})
+        return
+    yield sse_event("done", {"count": count, "path": "llm"})
+
+async def stream_items(items: List[dict], event: str) -> AsyncIterator[str]:
+    """Server-sent events for items the rule engine produced, shaped like `stream_llm`'s."""
+    for item in items:
+        yield sse_event(event, item)
+    yield sse_event("done", {"count": len(items), "path": "rules"})
+
+def stream_response(run: PipelineRun, events: AsyncIterator[str]):
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "Server-Timing": run.server_timing()},
+    )
+
+@app.post("/events/stream")
+async def stream_farm_advisory(request: FarmRequest):
+    """Like /events, but streams each advisory as an `advisory` event as soon as it is generated."""
+    try:
+        farm_data = request.dict()
+        run = await run_stages([weather_stage(farm_data), model_stage(), retrieval_stage(farm_data)])
+        items = fast_path("events", farm_data, run.results["weather"], template_advisories)
+        if items is not None:
+            return stream_response(run, stream_items(items, "advisory"))
+        prompt = advisories_prompt(farm_data, run.results["weather"], run.results["retrieval"])
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return stream_response(run, stream_llm(prompt, (None, "advisories"), "advisory"))
 
+@app.post("/generate-tasks/stream")
+async def stream_tasks(request: FarmRequestTasks):
+    """Like /generate-tasks, but streams each task as a `task` event as soon as it is generated."""
+    try:
+        farm_data = request.dict()
+        run = await run_stages([weather_stage(farm_data), model_stage(), retrieval_stage(farm_data)])
+        items = fast_path("generate-tasks", farm_data, run.results["weather"], template_tasks)
+        if items is not None:
+            return stream_response(run, stream_items(items, "task"))
+        prompt = tasks_prompt(farm_data, run.results["weather"], run.results["retrieval"])
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return stream_response(run, stream_llm(prompt, ("tasks",), "task"))
 
-@app.post("/generate-report")
-async def generate_updated_tasks(request: FarmRequestUpdatedTasks):
+@app.post("/generate-report/stream")
+async def stream_report(request: FarmRequestUpdatedTasks):
+    """Like /generate-report, but streams each report line as a `farm_health`, `risk_analysis` or `yield_forecast` event."""
     try:
         farm_data = request.dict()
-        latitude, longitude = farm_data["farm_info"]["latitude"], farm_data["farm_info"]["longitude"]
+        run = await run_stages([weather_stage(farm_data)])
+        prompt = report_prompt(farm_data, run.results["weather"])
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return stream_response(run, stream_llm(prompt, ("farm_health", "risk_analysis", "yield_forecast"), None))
 
-        # Fetch weather forecast
-        weather_forecast = fetch_weather_forecast(latitude, longitude)
-        if not weather_forecast:
-            raise HTTPException(status_code=500, detail="Weather API fetch failed.")
 
-        # Generate advisories using LLM with Qdrant context
-        advisories = summary_report(farm_data, weather_forecast)
+async def run_job(stages_for, farm_data: dict):
+    llm_priority.set(BACKGROUND)
+    run = await run_stages(stages_for(farm_data))
+    return jsonable_encoder(run.results["llm"])
 
-        return advisories
+webhook_client = httpx.AsyncClient(timeout=JOB_WEBHOOK_TIMEOUT)
 
+async def deliver_job_callback(job):
+    """POST the finished job to the callback URL given at submission."""
+    try:
+        # Checked again at delivery: the host may resolve differently now, and recovered jobs predate the check
+        await check_callback_url(job.callback_url, JOB_CALLBACK_HOSTS)
+        response = await webhook_client.post(job.callback_url, json=job.to_dict())
+        response.raise_for_status()
+    except Exception:
+        handled_errors.inc(path="job_callback")
+        raise
+
+job_queue = JobQueue(
+    handlers={
+        "updated-tasks": lambda farm_data: run_job(updated_tasks_stages, farm_data),
+        "generate-report": lambda farm_data: run_job(report_stages, farm_data),
+    },
+    workers=JOB_WORKERS,
+    max_pending=JOB_MAX_PENDING,
+    result_ttl=JOB_RESULT_TTL,
+    path=os.getenv("JOB_DB_PATH") or None,
+    notify=deliver_job_callback,
+)
+
+async def submit_job(kind: str, farm_data: dict, priority: str, callback_url: Optional[str], tenant: Optional[str], response: Response):
+    try:
+        if callback_url is not None:
+            await check_callback_url(callback_url, JOB_CALLBACK_HOSTS)
+        job = await job_queue.submit(
+            kind,
+            farm_data,
+            # Fairness is per tenant; without the header each device counts as its own tenant
+            tenant=tenant or farm_data["farm_info"]["deviceId"],
+            priority=priority,
+            callback_url=callback_url,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    response.status_code = 202
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return {"jobId": job.id, "status": job.status, "statusUrl": f"/jobs/{job.id}"}
+
+@app.post("/updated-tasks/jobs")
+async def submit_updated_tasks_job(
+    request: FarmRequestUpdatedTasks,
+    response: Response,
+    priority: str = Query("normal"),
+    callback_url: Optional[str] = Query(None),
+    x_tenant_id: Optional[str] = Header(None),
+):
+    """Queue an /updated-tasks run and return its job id at once; poll /jobs/{id} or pass callback_url."""
+    return await submit_job("updated-tasks", request.dict(), priority, callback_url, x_tenant_id, response)
+
+@app.post("/generate-report/jobs")
+async def submit_report_job(
+    request: FarmRequestUpdatedTasks,
+    response: Response,
+    priority: str = Query("normal"),
+    callback_url: Optional[str] = Query(None),
+    x_tenant_id: Optional[str] = Header(None),
+):
+    """Queue a /generate-report run and return its job id at once; poll /jobs/{id} or pass callback_url."""
+    return await submit_job("generate-report", request.dict(), priority, callback_url, x_tenant_id, response)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+    return job.to_dict()
+
+device_store = DeviceStateStore(
+    history=DEVICE_HISTORY,
+    max_devices=DEVICE_STATE_MAX_DEVICES,
+    path=os.getenv("DEVICE_STATE_PATH") or None,
+)
+
+def check_device_id(device_id: str, farm_info: Optional[dict]):
+    # Caches and the change gate key on farm_info.deviceId, so it must name the device in the path
+    if farm_info is not None and farm_info["deviceId"] != device_id:
+        raise HTTPException(
+            status_code=422,
+            detail=f"farm_info.deviceId '{farm_info['deviceId']}' does not match the device '{device_id}' in the path.",
+        )
+
+async def device_farm_data(device_id: str, update: BaseModel) -> dict:
+    """Apply the update to the device's stored state and build the full request body from it."""
+    body = update.dict()
+    check_device_id(device_id, body["farm_info"])
+    if body["farm_info"] is None:
+        # Checked before storing anything, so a rejected request leaves the device untouched
+        stored = await device_store.get(device_id)
+        if stored is None or stored.farm_info is None:
+            raise HTTPException(status_code=404, detail=f"No farm_info stored for device '{device_id}'; send it once first.")
+    state = await device_store.update(device_id, farm_info=body.pop("farm_info"), readings=body.pop("npk_data"))
+    return {"farm_info": state.farm_info, "npk_data": state.readings.records(device_id), **body}
+
+@app.post("/devices/{device_id}/readings")
+async def update_device(device_id: str, update: DeviceUpdate):
+    """Store new readings (and optionally a new farm profile) without running the pipeline."""
+    body = update.dict()
+    check_device_id(device_id, body["farm_info"])
+    state = await device_store.update(device_id, farm_info=body["farm_info"], readings=body["npk_data"])
+    latest = state.readings.records(device_id)[-1]["createdAt"] if state.readings.count else None
+    return {"deviceId": device_id, "readings": state.readings.count, "latestReadingAt": latest}
+
+@app.post("/devices/{device_id}/events")
+async def device_advisory(device_id: str, update: DeviceUpdate, response: Response, refresh: bool = Query(False)):
+    try:
+        return await run_pipeline(advisory_stages(await device_farm_data(device_id, update), refresh), response)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/devices/{device_id}/generate-tasks")
+async def device_tasks(device_id: str, update: DeviceUpdateTasks, response: Response, refresh: bool = Query(False)):
+    try:
+        return await run_pipeline(tasks_stages(await device_farm_data(device_id, update), refresh), response)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/devices/{device_id}/updated-tasks")
+async def device_updated_tasks(device_id: str, update: DeviceUpdateUpdatedTasks, response: Response, refresh: bool = Query(False)):
+    try:
+        return await run_pipeline(updated_tasks_stages(await device_farm_data(device_id, update), refresh), response)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/devices/{device_id}/generate-report")
+async def device_report(device_id: str, update: DeviceUpdateUpdatedTasks, response: Response, refresh: bool = Query(False)):
+    try:
+        return await run_pipeline(report_stages(await device_farm_data(device_id, update), refresh), response)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -746,6 +1481,82 @@ async def generate_updated_tasks(request: FarmRequestUpdatedTasks):
 async def root():
     return {"message": "Welcome to AgriSense FastAPI"}
 
+@app.get("/stats")
+async def stats():
+    """Cache counters for the weather, embedding and LLM caches, and LLM output parse metrics."""
+    return {
+        "weatherCache": forecast_cache.stats(),
+        "embeddingCache": embedding_cache.stats(),
+        "llmCache": llm_cache.stats(),
+        "llmParse": structured_output.stats(),
+        "rules": rule_engine.stats(),
+        "changeGate": change_gate.stats(),
+        "jobs": job_queue.stats(),
+        "devices": device_store.stats(),
+        "llmGateway": llm_gateway.stats(),
+    }
+
+def cache_counters() -> dict:
+    return {"weather": forecast_cache.stats(), "embedding": embedding_cache.stats(), "llm": llm_cache.stats()}
+
+def cache_ratio_samples() -> list:
+    samples = []
+    for cache, counters in cache_counters().items():
+        lookups = counters["hits"] + counters["misses"]
+        if lookups:
+            samples.append(({"cache": cache}, counters["hits"] / lookups))
+    return samples
+
+def parse_samples() -> list:
+    return [
+        ({"endpoint": endpoint, "outcome": outcome}, counters[outcome])
+        for endpoint, counters in structured_output.stats().items()
+        for outcome in ("responses", "parsed", "repaired", "retries", "failed", "invalidItems")
+    ]
+
+metrics.collector(
+    "agrisense_cache_hits_total", "counter", "Cache hits per cache.",
+    lambda: [({"cache": cache}, counters["hits"]) for cache, counters in cache_counters().items()],
+)
+metrics.collector(
+    "agrisense_cache_misses_total", "counter", "Cache misses per cache.",
+    lambda: [({"cache": cache}, counters["misses"]) for cache, counters in cache_counters().items()],
+)
+metrics.collector("agrisense_cache_hit_ratio", "gauge", "Cache hit ratio per cache.", cache_ratio_samples)
+metrics.collector(
+    "agrisense_llm_concurrency_limit", "gauge", "Current adaptive LLM concurrency limit.",
+    lambda: [({}, llm_gateway.limit)],
+)
+metrics.collector(
+    "agrisense_llm_in_flight", "gauge", "LLM calls holding a gateway slot.", lambda: [({}, llm_gateway.in_flight)],
+)
+metrics.collector("agrisense_jobs_queued", "gauge", "Jobs waiting for a worker.", lambda: [({}, job_queue.queued)])
+metrics.collector("agrisense_llm_parse_total", "counter", "LLM output parse outcomes per endpoint.", parse_samples)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage latency histograms, handled-error and token counters and cache ratios in Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.delete("/cache/{device_id}")
+async def invalidate_device_cache(device_id: str, endpoint: Optional[List[str]] = Query(None)):
+    """Drop cached LLM results for a device, e.g. after its tasks or advisories were edited."""
+    return {"deviceId": device_id, "invalidated": llm_cache.invalidate(device_id, endpoint)}
+
+@app.get("/ready")
+async def ready(response: Response):
+    """Readiness probe: 200 once the embedding model is loaded, 503 while it is warming up."""
+    if not embedding_model.ready:
+        response.status_code = 503
+    return {
+        "status": "ready" if embedding_model.ready else "starting",
+        "embeddingModel": embedding_model.status,
+        "embeddingBackend": embedding_model.backend,
+        "retrievalMode": advisory_retriever.mode,
+        "localIndexPoints": len(advisory_retriever.local_index),
+        "loadSeconds": embedding_model.load_seconds,
+    }
+
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000)
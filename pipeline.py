@@ -0,0 +1,120 @@
+"""
+Small stage-graph executor for the advisory/task pipeline.
+
+A pipeline is a list of stages. Each stage names the stages it depends on and
+starts as soon as all of them have finished, so independent stages (weather
+lookup, embedding + vector search) overlap instead of running back to back.
+Every stage gets its own timeout and its start/end offsets are recorded so the
+critical path of a request can be inspected afterwards.
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+
+class StageTimeout(asyncio.TimeoutError):
+    """Raised when a required stage exceeds its timeout."""
+
+    def __init__(self, name: str, timeout: float):
+        super().__init__(f"Stage '{name}' timed out after {timeout:.1f}s")
+        self.name = name
+        self.timeout = timeout
+
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable[[Dict[str, Any]], Awaitable[Any]]
+    deps: Sequence[str] = ()
+    timeout: Optional[float] = None
+    # Required stages abort the whole pipeline on failure; optional stages
+    # fall back to `default` and let dependants carry on.
+    required: bool = False
+    default: Any = None
+
+
+@dataclass
+class StageTiming:
+    start: float
+    end: float
+    status: str
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+@dataclass
+class PipelineRun:
+    results: Dict[str, Any] = field(default_factory=dict)
+    timings: Dict[str, StageTiming] = field(default_factory=dict)
+    deps: Dict[str, Sequence[str]] = field(default_factory=dict)
+
+    def critical_path(self) -> List[str]:
+        """Return the chain of stages that determined the total latency."""
+        if not self.timings:
+            return []
+        path = [max(self.timings, key=lambda name: self.timings[name].end)]
+        while True:
+            upstream = [dep for dep in self.deps.get(path[-1], ()) if dep in self.timings]
+            if not upstream:
+                break
+            path.append(max(upstream, key=lambda name: self.timings[name].end))
+        return list(reversed(path))
+
+    def server_timing(self) -> str:
+        """Format stage durations as a `Server-Timing` header value."""
+        return ", ".join(
+            f'{name};dur={timing.duration * 1000:.1f};desc="{timing.status}"'
+            for name, timing in self.timings.items()
+        )
+
+
+async def run_stages(stages: Sequence[Stage]) -> PipelineRun:
+    """Run `stages` respecting their dependencies and return results and timings."""
+    run = PipelineRun(deps={stage.name: tuple(stage.deps) for stage in stages})
+    # A dependency must be listed before its dependants; this also rules out cycles.
+    seen = set()
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in seen]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on stages not listed before it: {missing}")
+        seen.add(stage.name)
+
+    origin = time.perf_counter()
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def execute(stage: Stage):
+        if stage.deps:
+            await asyncio.gather(*(tasks[dep] for dep in stage.deps))
+        start = time.perf_counter() - origin
+        status = "cancelled"
+        try:
+            result = await asyncio.wait_for(stage.func(run.results), timeout=stage.timeout)
+            status = "ok"
+        except asyncio.TimeoutError:
+            status = "timeout"
+            if stage.required:
+                raise StageTimeout(stage.name, stage.timeout)
+            result = stage.default
+        except Exception:
+            status = "error"
+            if stage.required:
+                raise
+            result = stage.default
+        finally:
+            run.timings[stage.name] = StageTiming(start, time.perf_counter() - origin, status)
+        run.results[stage.name] = result
+
+    for stage in stages:
+        tasks[stage.name] = asyncio.create_task(execute(stage))
+
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+    return run
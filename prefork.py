@@ -0,0 +1,158 @@
+"""
+Multi-process server that loads the embedding model once and forks the workers from it.
+
+Usage:
+    python prefork.py --workers 4 --torch-threads 1 [--host 0.0.0.0] [--port 8000]
+
+`uvicorn --workers N` starts N fresh interpreters. Each one imports torch and
+loads MiniLM on its own, so RSS and cold start grow with N. Here the master
+instead:
+1. imports the app;
+2. loads the model and freezes the garbage collector's view of everything
+   loaded so far;
+3. binds the listening socket;
+4. forks the workers.
+Workers begin with the master's pages mapped copy-on-write. The weights are
+therefore resident once, however many workers there are, and a worker can
+serve as soon as it is forked. The master restarts workers that die and
+passes SIGINT/SIGTERM on to them.
+
+--no-preload has every worker import the app and load the model itself after
+the fork, the same as `uvicorn --workers`. It is there for comparison.
+
+Each worker limits torch to --torch-threads intra-op threads (default: the
+cores divided by the workers), so the workers do not oversubscribe the CPU.
+
+Caches and request coalescing are in memory, so each worker has its own. The
+SQLite tiers (WEATHER_CACHE_PATH, JOB_DB_PATH, DEVICE_STATE_PATH) are
+shared. With more than one worker and a DEVICE_STATE_PATH, device state is
+read from SQLite on every request (DEVICE_STATE_MAX_DEVICES defaults to 0), so
+all workers see the same readings. Without DEVICE_STATE_PATH each worker only
+knows the devices it has served itself, so the /devices endpoints need one
+worker or a state path. Jobs are the same: without JOB_DB_PATH a job lives
+only in the worker that accepted it, and polling /jobs/{id} through another
+worker returns 404. Only the first worker re-queues jobs left over from a
+previous run.
+"""
+import argparse
+import gc
+import importlib
+import logging
+import os
+import signal
+import socket
+import sys
+from typing import Dict
+
+import uvicorn
+
+from embeddings import limit_torch_threads
+
+logger = logging.getLogger("agrisense")
+
+
+def bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def load(module: str):
+    service = importlib.import_module(module)
+    service.embedding_model.load()
+    logger.info("embedding model loaded in %.1fs (pid %d)", service.embedding_model.load_seconds, os.getpid())
+    return service
+
+
+def serve(
+    host: str,
+    port: int,
+    workers: int,
+    torch_threads: int,
+    log_level: str = "info",
+    module: str = "main",
+    preload: bool = True,
+):
+    """Serve `module`'s `app` from `workers` forked processes, importing it and its model once up front if `preload`."""
+    # Read by OpenMP/MKL when torch is first imported, and by main.py for ONNX Runtime
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "EMBEDDING_THREADS"):
+        os.environ.setdefault(name, str(torch_threads))
+    if workers > 1:
+        if os.getenv("DEVICE_STATE_PATH"):
+            os.environ.setdefault("DEVICE_STATE_MAX_DEVICES", "0")
+        else:
+            logger.warning("DEVICE_STATE_PATH is not set, so device state is not shared between the %d workers", workers)
+        if not os.getenv("JOB_DB_PATH"):
+            logger.warning("JOB_DB_PATH is not set, so jobs are not shared between the %d workers", workers)
+
+    service = None
+    if preload:
+        service = load(module)
+        # Objects that exist now are never collected; keeping the collector off them keeps their pages shared
+        gc.collect()
+        gc.freeze()
+
+    sock = bind(host, port)
+    children: Dict[int, int] = {}
+    stopping = False
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.environ["AGRISENSE_WORKER"] = str(index)
+            limit_torch_threads(torch_threads)
+            config = uvicorn.Config((service or load(module)).app, log_level=log_level)
+            uvicorn.Server(config).run(sockets=[sock])
+            os._exit(0)
+        children[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for index in range(workers):
+        spawn(index)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is not None and not stopping:
+            logger.warning("worker %d (pid %d) exited with status %d, restarting", index, pid, status)
+            spawn(index)
+    sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", "1")))
+    parser.add_argument("--torch-threads", type=int, default=int(os.getenv("TORCH_THREADS", "0")),
+                        help="intra-op threads per worker (default: cores / workers)")
+    parser.add_argument("--no-preload", action="store_true", help="load the app in every worker instead")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), stream=sys.stderr)
+    serve(
+        args.host,
+        args.port,
+        args.workers,
+        args.torch_threads or max(1, (os.cpu_count() or 1) // args.workers),
+        args.log_level,
+        preload=not args.no_preload,
+    )
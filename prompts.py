@@ -0,0 +1,167 @@
+"""
+Prompt assembly for the LLM endpoints.
+
+Instead of pasting indented JSON of the whole forecast and sensor history into
+every prompt, the data sections are rendered as compact tables and summaries.
+Each section offers several renderings from most to least detailed;
+`build_prompt` starts with the most detailed ones and steps down the largest
+section until the prompt fits the endpoint's token budget.
+"""
+import json
+import math
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Sequence
+
+from sensor_summary import describe, summarize
+
+# Visual Crossing day fields the prompts actually use; the API returns ~40
+WEATHER_FIELDS = (
+    "datetime", "tempmax", "tempmin", "humidity", "precip", "precipprob",
+    "windspeed", "cloudcover", "uvindex", "conditions",
+)
+WEATHER_FIELDS_BRIEF = ("datetime", "tempmax", "tempmin", "precip", "conditions")
+
+SENSOR_COLUMNS = {
+    "createdAt": "time",
+    "nitrogen": "N",
+    "phosphorus": "P",
+    "potassium": "K",
+    "pH": "pH",
+    "conductivity": "EC",
+    "humidity": "moisture",
+    "temperature": "temp",
+}
+
+# Farm fields that identify the device rather than describe the farm
+FARM_IDENTIFIERS = ("id", "deviceId", "latitude", "longitude")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for Llama-family tokenizers)."""
+    return math.ceil(len(text) / 4)
+
+
+def compact_json(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def table(rows: Sequence[dict], columns: Dict[str, str]) -> str:
+    """Render dict rows as a pipe-separated table with one header line."""
+    lines = ["|".join(columns.values())]
+    for row in rows:
+        lines.append("|".join("" if row.get(key) is None else str(row.get(key)) for key in columns))
+    return "\n".join(lines)
+
+
+def weather_renderings(weather_forecast: list) -> List[str]:
+    if not weather_forecast:
+        return ["No forecast available."]
+    present = {key for day in weather_forecast for key, value in day.items() if value is not None}
+    return [
+        table(weather_forecast, {name: name for name in fields if name in present})
+        for fields in (WEATHER_FIELDS, WEATHER_FIELDS_BRIEF)
+    ]
+
+
+def sensor_renderings(npk_data: list) -> List[str]:
+    if not npk_data:
+        return ["No sensor readings."]
+    summary = describe(summarize(npk_data))
+    readings = sorted(npk_data, key=lambda entry: entry.get("createdAt", ""))
+    renderings = []
+    for recent in (10, 3):
+        if len(readings) > recent or not renderings:
+            rows = readings[-recent:]
+            renderings.append(f"Summary: {summary}\nLatest {len(rows)} readings:\n{table(rows, SENSOR_COLUMNS)}")
+    renderings.append(f"Summary: {summary}")
+    return renderings
+
+
+def farm_profile(farm_info: dict, exclude: Sequence[str] = ()) -> str:
+    """Farm fields not already shown elsewhere in the prompt, as `key: value` pairs."""
+    skip = set(FARM_IDENTIFIERS) | set(exclude)
+    return "; ".join(
+        f"{key}: {', '.join(value) if isinstance(value, list) else value}"
+        for key, value in farm_info.items()
+        if key not in skip
+    )
+
+
+def records_renderings(records: list, drop: Sequence[str] = (), keep_latest: int = 3) -> List[str]:
+    """Advisory/task lists as compact JSON, then only the latest few, then titles only."""
+    if not records:
+        return ["None."]
+    records = [{key: value for key, value in record.items() if key not in drop} for record in records]
+    renderings = [compact_json(records)]
+    if len(records) > keep_latest:
+        renderings.append(compact_json(records[-keep_latest:]))
+    title_key = "title" if "title" in records[0] else "taskTitle"
+    if title_key in records[0]:
+        renderings.append("; ".join(str(record.get(title_key)) for record in records[-keep_latest:]))
+    return renderings
+
+
+def retrieval_renderings(results: list) -> List[str]:
+    if not results:
+        return ["No similar past advisories found."]
+
+    def clipped(max_chars: int) -> str:
+        return compact_json([
+            {
+                key: value[:max_chars] + "..." if isinstance(value, str) and len(value) > max_chars else value
+                for key, value in result["payload"].items()
+            }
+            for result in results
+        ])
+
+    return [clipped(4500), clipped(1500), clipped(400)]
+
+
+@dataclass
+class Prompt:
+    endpoint: str
+    text: str
+    tokens: int
+    budget: int
+    sections: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def over_budget(self) -> bool:
+        return self.tokens > self.budget
+
+
+def build_prompt(
+    endpoint: str,
+    render: Callable[[Dict[str, str]], str],
+    sections: Dict[str, List[str]],
+    budget: int,
+) -> Prompt:
+    """
+    Render `render(data)` with the most detailed section renderings that fit `budget` tokens.
+
+    While the prompt is over budget, the section currently using the most
+    tokens that still has a shorter rendering is stepped down one level.
+    """
+    levels = {name: 0 for name in sections}
+
+    def current() -> Dict[str, str]:
+        return {name: sections[name][level] for name, level in levels.items()}
+
+    text = render(current())
+    tokens = estimate_tokens(text)
+    while tokens > budget:
+        reducible = [name for name, level in levels.items() if level + 1 < len(sections[name])]
+        if not reducible:
+            break
+        largest = max(reducible, key=lambda name: estimate_tokens(sections[name][levels[name]]))
+        levels[largest] += 1
+        text = render(current())
+        tokens = estimate_tokens(text)
+
+    return Prompt(
+        endpoint=endpoint,
+        text=text,
+        tokens=tokens,
+        budget=budget,
+        sections={name: estimate_tokens(value) for name, value in current().items()},
+    )
@@ -0,0 +1,318 @@
+"""
+Retrieval of past advisories from the Qdrant `documents` collection.
+
+`AdvisoryRetriever` can narrow searches to the farm's crop and soil type through
+keyword payload filters on configured fields (falling back to an unfiltered
+search when the filter matches nothing), asks Qdrant for only the payload fields the prompts use,
+batches many queries into one `search_batch` call and exposes `hnsw_ef` and
+quantization search parameters for trading recall against speed.
+
+`LocalVectorIndex` is an in-process replica of the collection: a float32
+matrix (memory-mapped when persisted) plus a payload list, searched with
+vectorized NumPy top-k. The retriever can use it instead of Qdrant (`local`)
+or only when Qdrant fails or is slow (`fallback`).
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from qdrant_client.models import (
+    FieldCondition,
+    Filter,
+    MatchValue,
+    PayloadSchemaType,
+    QuantizationSearchParams,
+    SearchParams,
+    SearchRequest,
+)
+
+logger = logging.getLogger("agrisense")
+
+
+def truncate_text(text, max_chars=4500):
+    """Truncate text to the specified character limit."""
+    if isinstance(text, str):
+        return text[:max_chars] + "..." if len(text) > max_chars else text
+    return text  # If it's not a string, return as is
+
+
+class LocalHit(NamedTuple):
+    id: object
+    score: float
+    payload: dict
+
+
+class LocalVectorIndex:
+    """Snapshot of a Qdrant collection searched in-process with cosine similarity."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.refreshed_at: Optional[float] = None
+        # (unit-normalized vectors, point ids, payloads), swapped as a whole on refresh
+        self._snapshot: Optional[Tuple[np.ndarray, list, List[dict]]] = None
+        self._masks: Dict[Tuple[str, object], np.ndarray] = {}
+
+    @property
+    def ready(self) -> bool:
+        return self._snapshot is not None
+
+    def __len__(self) -> int:
+        return len(self._snapshot[1]) if self._snapshot else 0
+
+    def _files(self) -> Tuple[str, str]:
+        return os.path.join(self.path, "vectors.npy"), os.path.join(self.path, "points.json")
+
+    def load(self) -> bool:
+        """Memory-map a previously saved snapshot; returns False when there is none."""
+        if not self.path:
+            return False
+        vectors_file, points_file = self._files()
+        if not (os.path.exists(vectors_file) and os.path.exists(points_file)):
+            return False
+        with open(points_file, encoding="utf-8") as f:
+            points = json.load(f)
+        self._swap(np.load(vectors_file, mmap_mode="r"), points["ids"], points["payloads"], points["refreshedAt"])
+        return True
+
+    def _save(self, vectors: np.ndarray, ids: list, payloads: List[dict], refreshed_at: float) -> np.ndarray:
+        os.makedirs(self.path, exist_ok=True)
+        vectors_file, points_file = self._files()
+        # Write next to the live files and rename, so a crash never leaves a torn snapshot
+        np.save(vectors_file + ".tmp.npy", vectors)
+        with open(points_file + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"ids": ids, "payloads": payloads, "refreshedAt": refreshed_at}, f)
+        os.replace(vectors_file + ".tmp.npy", vectors_file)
+        os.replace(points_file + ".tmp", points_file)
+        return np.load(vectors_file, mmap_mode="r")
+
+    def _swap(self, vectors: np.ndarray, ids: list, payloads: List[dict], refreshed_at: float):
+        self._snapshot = (vectors, ids, payloads)
+        self._masks = {}
+        self.refreshed_at = refreshed_at
+
+    async def refresh(self, client, collection_name: str, page_size: int = 256):
+        """Scroll the whole collection into a fresh snapshot."""
+        vectors, ids, payloads = [], [], []
+        offset = None
+        while True:
+            points, offset = await client.scroll(
+                collection_name=collection_name,
+                limit=page_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            for point in points:
+                vector = point.vector
+                if isinstance(vector, dict):
+                    # Named vectors: the collection's first (and usually only) vector
+                    vector = next(iter(vector.values()))
+                vectors.append(vector)
+                ids.append(point.id)
+                payloads.append(point.payload or {})
+            if offset is None:
+                break
+
+        # An empty collection gives an empty, but ready, index
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1) if vectors else np.zeros((0, 0), np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix /= np.where(norms == 0, 1, norms)
+        refreshed_at = time.time()
+        if self.path:
+            matrix = await asyncio.to_thread(self._save, matrix, ids, payloads, refreshed_at)
+        self._swap(matrix, ids, payloads, refreshed_at)
+        logger.info("local vector index refreshed with %d points", len(ids))
+
+    def _mask(self, key: str, value) -> np.ndarray:
+        mask = self._masks.get((key, value))
+        if mask is None:
+            payloads = self._snapshot[2]
+            mask = np.fromiter((payload.get(key) == value for payload in payloads), dtype=bool, count=len(payloads))
+            self._masks[(key, value)] = mask
+        return mask
+
+    def search(
+        self,
+        vectors: List[List[float]],
+        conditions: Sequence[Dict[str, object]],
+        limit: int,
+    ) -> List[List[LocalHit]]:
+        """Top-`limit` cosine matches per query, restricted to payloads matching each query's conditions."""
+        matrix, ids, payloads = self._snapshot
+        if not ids:
+            return [[] for _ in vectors]
+        queries = np.asarray(vectors, dtype=np.float32)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = queries @ matrix.T
+
+        results = []
+        for row, condition in zip(scores, conditions):
+            if condition:
+                allowed = np.ones(len(ids), dtype=bool)
+                for key, value in condition.items():
+                    allowed &= self._mask(key, value)
+                row = np.where(allowed, row, -np.inf)
+            k = min(limit, len(ids))
+            top = np.argpartition(-row, k - 1)[:k]
+            top = top[np.argsort(-row[top])]
+            results.append([LocalHit(ids[i], float(row[i]), payloads[i]) for i in top if np.isfinite(row[i])])
+        return results
+
+
+class AdvisoryRetriever:
+    def __init__(
+        self,
+        client,
+        collection_name: str,
+        limit: int = 1,
+        crop_key: Optional[str] = None,
+        soil_key: Optional[str] = None,
+        payload_fields: Sequence[str] = (),
+        hnsw_ef: Optional[int] = None,
+        exact: bool = False,
+        quantization_oversampling: Optional[float] = None,
+        max_chars: int = 4500,
+        mode: str = "remote",
+        local_index: Optional[LocalVectorIndex] = None,
+        remote_timeout: Optional[float] = None,
+    ):
+        if mode not in ("remote", "local", "fallback"):
+            raise ValueError(f"Unknown retrieval mode '{mode}'")
+        self.client = client
+        self.collection_name = collection_name
+        self.limit = limit
+        self.crop_key = crop_key
+        self.soil_key = soil_key
+        self.payload_fields = list(payload_fields)
+        self.max_chars = max_chars
+        # remote: Qdrant only; local: the in-process replica once it is loaded;
+        # fallback: Qdrant, switching to the replica when Qdrant errors or exceeds remote_timeout
+        self.mode = mode
+        self.local_index = local_index if local_index is not None else LocalVectorIndex()
+        self.remote_timeout = remote_timeout
+        quantization = None
+        if quantization_oversampling is not None:
+            quantization = QuantizationSearchParams(rescore=True, oversampling=quantization_oversampling)
+        self.search_params = SearchParams(hnsw_ef=hnsw_ef, exact=exact, quantization=quantization)
+
+    @property
+    def with_payload(self):
+        # Only the configured fields are sent over the wire; everything when none are configured
+        return self.payload_fields or True
+
+    def conditions_for(self, crop: Optional[str], soil_type: Optional[str]) -> Dict[str, object]:
+        return {key: value for key, value in ((self.crop_key, crop), (self.soil_key, soil_type)) if key and value}
+
+    def filter_for(self, crop: Optional[str], soil_type: Optional[str]) -> Optional[Filter]:
+        conditions = [
+            FieldCondition(key=key, match=MatchValue(value=value))
+            for key, value in self.conditions_for(crop, soil_type).items()
+        ]
+        return Filter(must=conditions) if conditions else None
+
+    async def refresh_periodically(self, interval: float):
+        """Keep the local replica fresh; meant to run as a background task."""
+        while True:
+            try:
+                await self.local_index.refresh(self.client, self.collection_name)
+            except Exception as e:
+                logger.warning("local vector index refresh failed: %s", e)
+            await asyncio.sleep(interval)
+
+    async def ensure_indexes(self):
+        """Create keyword payload indexes on the filter fields so filtered searches stay fast."""
+        for key in (self.crop_key, self.soil_key):
+            if key:
+                await self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=key,
+                    field_schema=PayloadSchemaType.KEYWORD,
+                )
+
+    def format(self, search_results) -> List[dict]:
+        return [
+            {
+                "id": result.id,
+                "score": result.score,
+                "payload": {
+                    key: truncate_text(value, self.max_chars) if isinstance(value, str) else value
+                    for key, value in (result.payload or {}).items()
+                    if not self.payload_fields or key in self.payload_fields
+                },
+            }
+            for result in search_results
+        ]
+
+    def _request(self, vector: List[float], query_filter: Optional[Filter]) -> SearchRequest:
+        return SearchRequest(
+            vector=vector,
+            filter=query_filter,
+            limit=self.limit,
+            params=self.search_params,
+            with_payload=self.with_payload,
+        )
+
+    async def search(self, vector: List[float], crop: Optional[str] = None, soil_type: Optional[str] = None) -> List[dict]:
+        return (await self.search_many([vector], [crop], [soil_type]))[0]
+
+    async def search_many(
+        self,
+        vectors: List[List[float]],
+        crops: Sequence[Optional[str]],
+        soil_types: Sequence[Optional[str]],
+    ) -> List[List[dict]]:
+        """Search many query vectors in one round trip, retrying unmatched filtered queries unfiltered."""
+        if self.mode == "local" and self.local_index.ready:
+            return self._search_local(vectors, crops, soil_types)
+        if self.mode == "fallback" and self.local_index.ready:
+            try:
+                return await asyncio.wait_for(self._search_remote(vectors, crops, soil_types), self.remote_timeout)
+            except Exception as e:
+                logger.warning("qdrant search failed (%r), answering from the local index", e)
+                return self._search_local(vectors, crops, soil_types)
+        return await self._search_remote(vectors, crops, soil_types)
+
+    def _search_local(
+        self,
+        vectors: List[List[float]],
+        crops: Sequence[Optional[str]],
+        soil_types: Sequence[Optional[str]],
+    ) -> List[List[dict]]:
+        conditions = [self.conditions_for(crop, soil_type) for crop, soil_type in zip(crops, soil_types)]
+        results = self.local_index.search(vectors, conditions, self.limit)
+        unmatched = [i for i, hits in enumerate(results) if not hits and conditions[i]]
+        if unmatched:
+            retried = self.local_index.search([vectors[i] for i in unmatched], [{} for _ in unmatched], self.limit)
+            for i, hits in zip(unmatched, retried):
+                results[i] = hits
+        return [self.format(hits) for hits in results]
+
+    async def _search_remote(
+        self,
+        vectors: List[List[float]],
+        crops: Sequence[Optional[str]],
+        soil_types: Sequence[Optional[str]],
+    ) -> List[List[dict]]:
+        filters = [self.filter_for(crop, soil_type) for crop, soil_type in zip(crops, soil_types)]
+        results = await self.client.search_batch(
+            collection_name=self.collection_name,
+            requests=[self._request(vector, query_filter) for vector, query_filter in zip(vectors, filters)],
+        )
+        results = [list(hits) for hits in results]
+
+        unmatched = [i for i, hits in enumerate(results) if not hits and filters[i] is not None]
+        if unmatched:
+            logger.debug("retrieval filter matched nothing for %d queries, retrying unfiltered", len(unmatched))
+            retried = await self.client.search_batch(
+                collection_name=self.collection_name,
+                requests=[self._request(vectors[i], None) for i in unmatched],
+            )
+            for i, hits in zip(unmatched, retried):
+                results[i] = list(hits)
+
+        return [self.format(hits) for hits in results]
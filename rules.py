@@ -0,0 +1,202 @@
+"""
+Deterministic fast path for farms where nothing needs the LLM's judgement.
+
+`RangeTable` holds the ideal range of every sensor metric per crop, and
+optionally per growth stage. A stage entry overrides its crop's ranges metric
+by metric. `RuleEngine.evaluate` checks every recent reading and every
+forecast day against those ranges in one NumPy comparison each. A farm is
+handled by templates only when:
+- its crop is in the table;
+- it has readings and a forecast;
+- every value lies inside its range with `margin` to spare.
+Anything out of range, too close to a limit, missing or unknown goes to the
+LLM as before, and the reasons are returned so callers can log them.
+"""
+import json
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from sensor_summary import METRICS, reading_days, summarize
+
+Range = Tuple[float, float]
+
+# crop or "crop:growth stage" (lower case) -> metric -> (low, high)
+DEFAULT_RANGES: Dict[str, Dict[str, Range]] = {
+    "wheat": {
+        "nitrogen": (20, 80), "phosphorus": (10, 50), "potassium": (100, 250), "pH": (6.0, 7.5),
+        "conductivity": (0.2, 2.0), "humidity": (35, 70), "temperature": (8, 25),
+    },
+    "wheat:tillering": {"nitrogen": (30, 80)},
+    "wheat:grain filling": {"humidity": (30, 65), "temperature": (12, 28)},
+    "rice": {
+        "nitrogen": (25, 90), "phosphorus": (10, 50), "potassium": (80, 250), "pH": (5.5, 7.0),
+        "conductivity": (0.2, 1.5), "humidity": (60, 100), "temperature": (20, 35),
+    },
+    "maize": {
+        "nitrogen": (30, 90), "phosphorus": (15, 50), "potassium": (100, 250), "pH": (5.8, 7.5),
+        "conductivity": (0.2, 2.0), "humidity": (40, 75), "temperature": (15, 32),
+    },
+    "cotton": {
+        "nitrogen": (20, 80), "phosphorus": (10, 45), "potassium": (100, 250), "pH": (6.0, 8.0),
+        "conductivity": (0.2, 3.0), "humidity": (35, 70), "temperature": (18, 35),
+    },
+    "sugarcane": {
+        "nitrogen": (30, 100), "phosphorus": (10, 50), "potassium": (120, 300), "pH": (6.0, 7.8),
+        "conductivity": (0.2, 2.5), "humidity": (50, 85), "temperature": (20, 35),
+    },
+    "potato": {
+        "nitrogen": (25, 90), "phosphorus": (20, 60), "potassium": (150, 300), "pH": (5.2, 6.8),
+        "conductivity": (0.2, 1.8), "humidity": (55, 80), "temperature": (12, 24),
+    },
+    "tomato": {
+        "nitrogen": (25, 90), "phosphorus": (20, 60), "potassium": (150, 300), "pH": (6.0, 7.0),
+        "conductivity": (0.5, 2.5), "humidity": (50, 80), "temperature": (16, 30),
+    },
+}
+
+# Forecast field -> (low, high); None leaves that side open
+WEATHER_LIMITS: Dict[str, Tuple[Optional[float], Optional[float]]] = {
+    "tempmax": (None, 35.0),
+    "tempmin": (4.0, None),
+    "precip": (None, 20.0),
+    "windspeed": (None, 40.0),
+}
+
+
+class RangeTable:
+    def __init__(self, ranges: Dict[str, Dict[str, Range]]):
+        self.ranges = {key.strip().lower(): value for key, value in ranges.items()}
+
+    @classmethod
+    def from_file(cls, path: str) -> "RangeTable":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def lookup(self, crop: str, stage: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(low, high) arrays in `METRICS` order, or None when the crop is not in the table."""
+        crop = crop.strip().lower()
+        base = self.ranges.get(crop)
+        if base is None:
+            return None
+        merged = {**base, **self.ranges.get(f"{crop}:{stage.strip().lower()}", {})}
+        if any(metric not in merged for metric in METRICS):
+            return None
+        bounds = np.array([merged[metric] for metric in METRICS], dtype=np.float64)
+        return bounds[:, 0], bounds[:, 1]
+
+
+@dataclass
+class Verdict:
+    path: str
+    reasons: List[str] = field(default_factory=list)
+
+
+def _violations(
+    values: np.ndarray, low: np.ndarray, high: np.ndarray, margin: float, labels: List[str]
+) -> List[str]:
+    """Reasons for every column with a value outside, or within `margin` of, its range."""
+    with np.errstate(invalid="ignore"):
+        band = np.nan_to_num(margin * (high - low), nan=0.0, posinf=0.0)
+        below = (values < low).any(axis=0)
+        above = (values > high).any(axis=0)
+        near = ((values < low + band) | (values > high - band)).any(axis=0)
+    missing = np.isnan(values).any(axis=0)
+    reasons = []
+    for column in np.flatnonzero(below | above | near | missing):
+        label, column_values = labels[column], values[:, column]
+        if missing[column]:
+            reasons.append(f"{label} missing")
+        elif below[column]:
+            reasons.append(f"{label} {np.nanmin(column_values):g} below {low[column]:g}")
+        elif above[column]:
+            reasons.append(f"{label} {np.nanmax(column_values):g} above {high[column]:g}")
+        else:
+            reasons.append(f"{label} close to its limit")
+    return reasons
+
+
+class RuleEngine:
+    def __init__(self, table: RangeTable, margin: float = 0.1, window_hours: float = 48):
+        self.table = table
+        # Fraction of each range that counts as "too close to call" at either end
+        self.margin = margin
+        # Only readings this recent (relative to the newest one) are checked
+        self.window_hours = window_hours
+        self.evaluated = 0
+        self.fast = 0
+
+    def evaluate(self, farm_info: dict, npk_data: List[dict], weather_forecast: list) -> Verdict:
+        self.evaluated += 1
+        bounds = self.table.lookup(farm_info["crop"], farm_info["currentGrowthStage"])
+        if bounds is None:
+            return Verdict("llm", [f"no ranges for {farm_info['crop']} ({farm_info['currentGrowthStage']})"])
+        if not npk_data:
+            return Verdict("llm", ["no sensor readings"])
+        if not weather_forecast:
+            return Verdict("llm", ["no forecast"])
+
+        days = reading_days(npk_data)
+        recent = days >= days.max() - self.window_hours / 24
+        readings = np.array(
+            [[entry[metric] for metric in METRICS] for entry, keep in zip(npk_data, recent) if keep],
+            dtype=np.float64,
+        )
+        reasons = _violations(readings, *bounds, self.margin, list(METRICS.values()))
+
+        fields = list(WEATHER_LIMITS)
+        forecast = np.array(
+            [[np.nan if day.get(name) is None else day[name] for name in fields] for day in weather_forecast],
+            dtype=np.float64,
+        )
+        limits = np.array([WEATHER_LIMITS[name] for name in fields], dtype=np.float64)
+        # Open sides never trigger, and have no margin
+        low = np.where(np.isnan(limits[:, 0]), -np.inf, limits[:, 0])
+        high = np.where(np.isnan(limits[:, 1]), np.inf, limits[:, 1])
+        reasons += _violations(forecast, low, high, 0.0, [f"forecast {name}" for name in fields])
+
+        if reasons:
+            return Verdict("llm", reasons)
+        self.fast += 1
+        return Verdict("rules")
+
+    def stats(self) -> dict:
+        return {"evaluated": self.evaluated, "fastPath": self.fast}
+
+
+def _latest(npk_data: List[dict]) -> str:
+    summary = summarize(npk_data)
+    return ", ".join(f"{METRICS[metric]} {round(stats['last'], 2)}" for metric, stats in summary.items())
+
+
+def template_advisories(farm_info: dict, npk_data: List[dict], weather_forecast: list) -> List[dict]:
+    """The advisory for a farm whose readings and forecast are all comfortably in range."""
+    crop, stage = farm_info["crop"], farm_info["currentGrowthStage"]
+    highs = [day["tempmax"] for day in weather_forecast if day.get("tempmax") is not None]
+    outlook = f"highs up to {max(highs):g}°C" if highs else "no extreme conditions expected"
+    return [{
+        "title": f"{crop} at {stage}: conditions within ideal range",
+        "precaution": "No intervention needed; keep monitoring sensor readings for changes.",
+        "risk_factors": f"None detected. Latest readings: {_latest(npk_data)}. Forecast: {outlook}.",
+        "recommended_action": (
+            f"Continue the current {farm_info['irrigationType']} irrigation schedule and fertilizer plan "
+            f"({', '.join(farm_info['fertilizersUsed']) or 'none'})."
+        ),
+    }]
+
+
+def template_tasks(farm_info: dict, npk_data: List[dict], weather_forecast: list) -> List[dict]:
+    """The routine task for a farm whose readings and forecast are all comfortably in range."""
+    deadline = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) + timedelta(days=3)
+    return [{
+        "taskTitle": f"Routine field check for {farm_info['crop']}",
+        "taskDescription": (
+            f"All sensor readings are within the ideal range for {farm_info['currentGrowthStage']} "
+            f"({_latest(npk_data)}). Walk the field to confirm crop condition and keep the "
+            f"current {farm_info['irrigationType']} irrigation schedule."
+        ),
+        "taskSeverity": "LOW",
+        "deadliestDeadline": deadline.isoformat().replace("+00:00", "Z"),
+    }]
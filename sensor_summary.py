@@ -0,0 +1,74 @@
+"""
+Fixed-size statistical summary of a device's sensor history.
+
+Readings are stacked into one NumPy matrix and reduced column-wise, so the
+summary costs the same handful of array operations however many readings a
+device sends. Each metric is described by min/mean/max/last and a least-squares
+slope per day, which keeps the trend that raw concatenation loses once the
+embedding model truncates its input.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Request field -> label used in retrieval queries and prompts
+METRICS = {
+    "nitrogen": "Nitrogen",
+    "phosphorus": "Phosphorus",
+    "potassium": "Potassium",
+    "pH": "pH",
+    "conductivity": "EC",
+    "humidity": "Soil Moisture",
+    "temperature": "Soil Temperature",
+}
+STATISTICS = ("min", "mean", "max", "last", "slope")
+
+
+def reading_days(npk_data: List[dict]) -> np.ndarray:
+    """Reading times in days; falls back to one day per reading if createdAt does not parse."""
+    try:
+        seconds = [datetime.fromisoformat(entry["createdAt"].replace("Z", "+00:00")).timestamp() for entry in npk_data]
+        return np.asarray(seconds, dtype=np.float64) / 86400.0
+    except (KeyError, TypeError, ValueError):
+        return np.arange(len(npk_data), dtype=np.float64)
+
+
+def summarize(npk_data: List[dict]) -> Dict[str, Dict[str, float]]:
+    """Return {metric: {min, mean, max, last, slope}} for every metric in `METRICS`."""
+    if not npk_data:
+        return {}
+
+    values = np.array([[entry[metric] for metric in METRICS] for entry in npk_data], dtype=np.float64)
+    days = reading_days(npk_data)
+    order = np.argsort(days, kind="stable")
+    values, days = values[order], days[order]
+
+    centered_days = days - days.mean()
+    variance = float(centered_days @ centered_days)
+    if variance > 0:
+        slopes = centered_days @ (values - values.mean(axis=0)) / variance
+    else:
+        slopes = np.zeros(values.shape[1])
+
+    stats = np.vstack([values.min(axis=0), values.mean(axis=0), values.max(axis=0), values[-1], slopes])
+    return {
+        metric: dict(zip(STATISTICS, stats[:, column].tolist()))
+        for column, metric in enumerate(METRICS)
+    }
+
+
+def describe(summary: Dict[str, Dict[str, float]], precision: Optional[Dict[str, int]] = None) -> str:
+    """Render a summary as compact text, rounding each metric to `precision` decimal places."""
+    if not summary:
+        return "No sensor readings."
+    precision = precision or {}
+    parts = []
+    for metric, stats in summary.items():
+        digits = precision.get(metric, 2)
+        parts.append(
+            f"{METRICS[metric]} min {round(stats['min'], digits)}, mean {round(stats['mean'], digits)}, "
+            f"max {round(stats['max'], digits)}, last {round(stats['last'], digits)}, "
+            f"trend {round(stats['slope'], digits + 1):+}/day"
+        )
+    return "; ".join(parts)
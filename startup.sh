@@ -1,2 +1,6 @@
 #!/bin/sh
+# WORKERS > 1 serves from forked workers sharing one preloaded embedding model (see prefork.py)
+if [ "${WORKERS:-1}" -gt 1 ]; then
+    exec python prefork.py --host=0.0.0.0 --port=8000 --workers="$WORKERS"
+fi
 uvicorn main:app --host=0.0.0.0 --port=8000
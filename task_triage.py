@@ -0,0 +1,110 @@
+"""
+Local pre-pass over a device's pending tasks before /updated-tasks asks the LLM about them.
+
+Three kinds of task are settled without the LLM:
+- Tasks already in a final status (completed, cancelled, ...) cannot change
+  and are dropped.
+- Pending tasks whose deadliestDeadline has passed are marked expired.
+- Near-duplicates are merged. Tasks are compared by the cosine similarity of
+  their title + description embeddings, in one matrix product, and grouped
+  into connected components at `threshold`. Each group keeps its most recent
+  task and cancels the rest, the same rule the prompt gives the LLM.
+
+Only the tasks that are left go into the prompt, so its size follows the
+number of live, distinct tasks rather than the device's whole backlog.
+"""
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+import numpy as np
+
+FINAL_STATUSES = {"completed", "complete", "done", "cancelled", "canceled", "expired"}
+EXPIRED_STATUS = "Expired"
+CANCELLED_STATUS = "Cancelled"
+
+
+@dataclass
+class Triage:
+    # Tasks the LLM still has to review
+    candidates: List[dict] = field(default_factory=list)
+    # Updates decided locally, shaped like the LLM's `updatedTasks` items
+    updates: List[dict] = field(default_factory=list)
+    dropped: int = 0
+
+
+def task_text(task: dict) -> str:
+    return f"{task['taskTitle']}. {task['taskDescription']}"
+
+
+def _timestamp(value: Optional[str]) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+def is_final(task: dict) -> bool:
+    return str(task.get("taskStatus", "")).strip().lower() in FINAL_STATUSES
+
+
+def is_overdue(task: dict, now: float) -> bool:
+    deadline = _timestamp(task.get("deadliestDeadline"))
+    return deadline is not None and deadline < now
+
+
+def duplicate_groups(vectors: np.ndarray, threshold: float) -> np.ndarray:
+    """Component label for each row, joining rows whose cosine similarity reaches `threshold`."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.where(norms == 0, 1, norms)
+    similar = unit @ unit.T >= threshold
+    labels = np.arange(len(vectors))
+    # Each row takes the smallest label among its neighbours until nothing changes
+    while True:
+        spread = np.where(similar, labels[None, :], len(labels)).min(axis=1)
+        if np.array_equal(spread, labels):
+            return labels
+        labels = spread
+
+
+def triage_tasks(tasks: List[dict], now: Optional[float] = None) -> Triage:
+    """Drop tasks in a final status and expire overdue ones; the rest become candidates."""
+    now = time.time() if now is None else now
+    triage = Triage()
+    for task in tasks:
+        if is_final(task):
+            triage.dropped += 1
+            continue
+        if is_overdue(task, now):
+            triage.updates.append({
+                "id": task["id"],
+                "taskStatus": EXPIRED_STATUS,
+                "notes": f"Deadline {task['deadliestDeadline']} has passed.",
+            })
+            continue
+        triage.candidates.append(task)
+    return triage
+
+
+def merge_duplicates(triage: Triage, vectors: np.ndarray, threshold: float = 0.9) -> Triage:
+    """Keep the most recent task of each near-duplicate group; `vectors` embed `task_text` of each candidate."""
+    if len(triage.candidates) < 2:
+        return triage
+    tasks = triage.candidates
+    labels = duplicate_groups(np.asarray(vectors, dtype=np.float32), threshold)
+    created = [_timestamp(task.get("createdAt")) or 0.0 for task in tasks]
+    triage.candidates = []
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        # The most recent task wins; the id breaks ties
+        keep = max(members, key=lambda i: (created[i], str(tasks[i]["id"])))
+        triage.candidates.append(tasks[keep])
+        for i in members:
+            if i != keep:
+                triage.updates.append({
+                    "id": tasks[i]["id"],
+                    "taskStatus": CANCELLED_STATUS,
+                    "notes": f"Duplicate of the more recent task {tasks[keep]['id']}.",
+                })
+    return triage
@@ -0,0 +1,231 @@
+"""
+Client and forecast cache for the Visual Crossing timeline API.
+
+`WeatherClient` wraps a shared, pooled httpx client with bounded retries,
+jittered exponential backoff and a circuit breaker, raising
+`WeatherUnavailable` when no forecast can be obtained.
+
+Forecasts are keyed by a lat/lon grid cell rather than the exact farm
+coordinates, so neighbouring farms share one upstream call. Entries live in an
+in-memory LRU with a TTL and can optionally be mirrored to SQLite so they
+survive restarts. Concurrent misses for the same cell are coalesced into a
+single upstream request.
+"""
+import asyncio
+import json
+import random
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+
+Cell = Tuple[int, int]
+Fetcher = Callable[[float, float], Awaitable[Optional[list]]]
+
+TIMELINE_PATH = "/VisualCrossingWebServices/rest/services/timeline/{latitude},{longitude}/next3days"
+
+
+class WeatherUnavailable(Exception):
+    """Raised when the weather API cannot provide a forecast."""
+
+
+class CircuitBreaker:
+    """
+    Classic closed/open/half-open breaker.
+
+    After `failure_threshold` consecutive failures the breaker opens and calls
+    are rejected for `reset_timeout` seconds, after which a single probe call
+    is let through to decide whether to close again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def abandon_probe(self):
+        """Let another call probe when this one ended (e.g. was cancelled) without an outcome."""
+        self._probing = False
+
+
+class WeatherClient:
+    def __init__(
+        self,
+        http_client: httpx.AsyncClient,
+        api_key: Optional[str],
+        retries: int = 2,
+        backoff: float = 0.5,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.http_client = http_client
+        self.api_key = api_key
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+
+    async def fetch(self, latitude: float, longitude: float) -> list:
+        """Fetch the daily forecast, retrying transient failures with jittered backoff."""
+        probing = self.breaker.state == "half-open"
+        if not self.breaker.allow():
+            raise WeatherUnavailable("Weather API circuit is open.")
+
+        url = TIMELINE_PATH.format(latitude=latitude, longitude=longitude)
+        params = {"key": self.api_key, "contentType": "json", "include": "days"}
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    response = await self.http_client.get(url, params=params)
+                    response.raise_for_status()
+                    days = response.json().get("days", [])
+                    self.breaker.record_success()
+                    return days
+                except httpx.HTTPStatusError as e:
+                    # Client errors (bad key, bad coordinates) will not fix themselves
+                    status = e.response.status_code
+                    if status != 429 and status < 500:
+                        self.breaker.record_success()
+                        raise WeatherUnavailable(f"Weather API rejected the request ({status}).") from e
+                    error = e
+                except (httpx.TransportError, ValueError) as e:
+                    error = e
+                if attempt < self.retries:
+                    await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+        except WeatherUnavailable:
+            raise
+        except Exception as e:
+            # Anything unexpected (e.g. a JSON body that is not an object) counts against the API
+            self.breaker.record_failure()
+            raise WeatherUnavailable(f"Weather API returned an unusable response: {e!r}") from e
+        finally:
+            if probing:
+                # A no-op once the probe recorded its outcome; frees the slot if it was cancelled
+                self.breaker.abandon_probe()
+
+        self.breaker.record_failure()
+        raise WeatherUnavailable(f"Weather API fetch failed: {error}") from error
+
+    async def aclose(self):
+        await self.http_client.aclose()
+
+
+class ForecastCache:
+    def __init__(self, ttl: float = 1800, max_entries: int = 1024, grid: float = 0.1, path: Optional[str] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.grid = grid
+        self.path = path
+        self._entries: "OrderedDict[Cell, Tuple[float, list]]" = OrderedDict()
+        self._inflight: Dict[Cell, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        if path:
+            with sqlite3.connect(path) as db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS forecasts (cell TEXT PRIMARY KEY, stored_at REAL, days TEXT)"
+                )
+
+    def cell(self, latitude: float, longitude: float) -> Cell:
+        return (round(latitude / self.grid), round(longitude / self.grid))
+
+    def cell_center(self, cell: Cell) -> Tuple[float, float]:
+        return (round(cell[0] * self.grid, 4), round(cell[1] * self.grid, 4))
+
+    def _remember(self, cell: Cell, stored_at: float, forecast: list):
+        self._entries[cell] = (stored_at, forecast)
+        self._entries.move_to_end(cell)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load_from_disk(self, cell: Cell) -> Optional[Tuple[float, list]]:
+        with sqlite3.connect(self.path) as db:
+            row = db.execute("SELECT stored_at, days FROM forecasts WHERE cell = ?", (json.dumps(cell),)).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def _save_to_disk(self, cell: Cell, stored_at: float, forecast: list):
+        with sqlite3.connect(self.path) as db:
+            db.execute(
+                "INSERT OR REPLACE INTO forecasts (cell, stored_at, days) VALUES (?, ?, ?)",
+                (json.dumps(cell), stored_at, json.dumps(forecast)),
+            )
+
+    async def lookup(self, cell: Cell, allow_stale: bool = False) -> Optional[list]:
+        """Return the cached forecast for `cell`, checking memory first and then disk."""
+        entry = self._entries.get(cell)
+        if entry is None and self.path:
+            entry = await asyncio.to_thread(self._load_from_disk, cell)
+            if entry is not None:
+                self._remember(cell, *entry)
+        if entry is None:
+            return None
+        stored_at, forecast = entry
+        if not allow_stale and time.time() - stored_at > self.ttl:
+            return None
+        self._entries.move_to_end(cell)
+        return forecast
+
+    async def store(self, cell: Cell, forecast: list):
+        stored_at = time.time()
+        self._remember(cell, stored_at, forecast)
+        if self.path:
+            await asyncio.to_thread(self._save_to_disk, cell, stored_at, forecast)
+
+    async def get_or_fetch(self, latitude: float, longitude: float, fetch: Fetcher) -> Optional[list]:
+        """Return the forecast for the cell containing the point, fetching it at most once per TTL."""
+        cell = self.cell(latitude, longitude)
+        forecast = await self.lookup(cell)
+        if forecast is not None:
+            self.hits += 1
+            return forecast
+
+        task = self._inflight.get(cell)
+        if task is None:
+            self.misses += 1
+            task = asyncio.create_task(self._fetch_and_store(cell, fetch))
+            self._inflight[cell] = task
+            task.add_done_callback(lambda _: self._inflight.pop(cell, None))
+        else:
+            self.coalesced += 1
+        # Shielded so a cancelled caller does not cancel the fetch other callers share
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
+    async def _fetch_and_store(self, cell: Cell, fetch: Fetcher) -> Optional[list]:
+        forecast = await fetch(*self.cell_center(cell))
+        if forecast:
+            await self.store(cell, forecast)
+        return forecast